@@ -1,26 +1,74 @@
 import yaml
-from time import sleep
-from typing import Optional
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from time import perf_counter, sleep
+from typing import Dict, Literal, Optional
 
 import typer
-from pydantic import BaseModel
 from pydantic.error_wrappers import ValidationError
 from rich.console import Console
-from rich.progress import track
+from rich.table import Table
 
-from posting_app.database import create_db_and_tables, PostingRepository
-from posting_app.services import PostingServiceFactory
+from posting_app.database import (
+    configure_engine,
+    create_db_and_tables,
+    DatabaseConfig,
+    known_shas,
+    load_known_listing_ids,
+    load_known_shas,
+    OutboxRepository,
+    SendFailureRepository,
+)
+from posting_app.services import PostingService, PostingServiceFactory
+from scraper_app.gateways import (
+    cassette,
+    rate_limiter,
+    response_cache,
+    session_pool,
+)
+from scraper_app.parsers import parse_pool
+from telegram_app.limiter import telegram_limiter
+from telegram_app.messages import rendered_columns
+from telegram_app.outbox import OutboxSender
 from telegram_app.services import TelegramService
 
 console = Console()
 
 
-class Config(BaseModel):
+class Config(DatabaseConfig):
     pages: Optional[int] = 3
+    scrape_timeout: Optional[int] = 300
+    concurrent_requests_per_host: Optional[int] = 1
+    fast_parse: Optional[bool] = True
+    incremental_crawl: Optional[bool] = False
+    full_crawl_interval: Optional[int] = 3600
+    parse_workers: Optional[int] = 0
+    parse_pool_min_pages: Optional[int] = 4
     sleep_time: Optional[int] = 5
     bot_token: str
     chat_room: str
     persist: Optional[bool] = False
+    send_oldest_first: Optional[bool] = True
+    send_workers: Optional[int] = 1
+    telegram_messages_per_second: Optional[float] = 30
+    telegram_chat_messages_per_minute: Optional[float] = 20
+    outbox_claim_size: Optional[int] = 10
+    outbox_lease_seconds: Optional[int] = 300
+    outbox_max_attempts: Optional[int] = 5
+    outbox_retry_backoff: Optional[int] = 30
+    outbox_poll_interval: Optional[int] = 2
+    digest_backlog_threshold: Optional[int] = 30
+    digest_claim_size: Optional[int] = 40
+    known_shas_snapshot: Optional[str] = 'known_shas.bin'
+    send_failure_retention_days: Optional[int] = 30
+    http_cache_dir: Optional[str] = 'http_cache'
+    http_cache_ttl: Optional[int] = 86400
+    http_cache_max_mb: Optional[int] = 50
+    requests_per_second_per_host: Optional[float] = 1.0
+    max_requests_per_second_per_host: Optional[float] = 4.0
+    request_burst_per_host: Optional[int] = 2
+    cassette_mode: Optional[Literal['record', 'replay']] = None
+    cassette_dir: Optional[str] = 'cassettes'
+    cassette_latency: Optional[float] = 0.0
     zonaprop_base_url: Optional[str] = None
     zonaprop_full_url: Optional[str] = None
     argenprop_full_url: Optional[str] = None
@@ -29,6 +77,80 @@ class Config(BaseModel):
     properati_full_url: Optional[str] = None
 
 
+# Scrapes by site, they outlive the cycle that started them when they time out
+running_scrapes: Dict[str, Future] = {}
+
+
+def scrape_in_parallel(
+    posting_services: Dict[str, PostingService],
+    timeout: Optional[int] = None,
+):
+    '''
+    Runs every site's scrape in its own worker so a slow or failing
+    site doesn't hold back the others, then prints a timing summary.
+
+    A scrape can't be interrupted, one that times out keeps going in
+    the background and its site is skipped until it finishes.
+    '''
+    results = {}
+
+    def scrape(site: str, posting_service: PostingService):
+        started_at = perf_counter()
+        try:
+            inserted, _ = posting_service.scrap_and_create_postings()
+        except Exception as ex:
+            results[site] = ('failed', perf_counter() - started_at, 0, repr(ex))
+        else:
+            results[site] = ('ok', perf_counter() - started_at, inserted, '')
+
+    if not posting_services:
+        return
+
+    started_at = perf_counter()
+    executor = ThreadPoolExecutor(max_workers=len(posting_services))
+    futures = {}
+    for site, posting_service in posting_services.items():
+        previous = running_scrapes.get(site)
+        if previous is not None and not previous.done():
+            console.log(
+                f'{site} is still running from a previous cycle, skipping it',
+                style='yellow'
+            )
+            results[site] = ('still running', 0.0, 0, '')
+            continue
+        futures[site] = executor.submit(scrape, site, posting_service)
+    running_scrapes.update(futures)
+
+    wait(futures.values(), timeout=timeout)
+    # Don't block on sites that timed out, they finish in the background
+    executor.shutdown(wait=False)
+    elapsed = perf_counter() - started_at
+    for site, future in futures.items():
+        if not future.done():
+            console.log(
+                f'{site} is still running after {elapsed:.0f}s, it goes on in'
+                ' the background and won\'t be started again until it ends',
+                style='yellow'
+            )
+
+    table = Table(title='Scrape summary')
+    table.add_column('Site')
+    table.add_column('Status')
+    table.add_column('Seconds', justify='right')
+    table.add_column('New', justify='right')
+    table.add_column('Error')
+    for site in posting_services:
+        status, seconds, inserted, error = results.get(
+            site, ('still running', elapsed, 0, '')
+        )
+        style = {'ok': 'green', 'still running': 'yellow'}.get(status, 'red')
+        table.add_row(
+            site, status, f'{seconds:.2f}', str(inserted), error, style=style
+        )
+    console.print(table)
+    console.log(f'Scrape phase took {elapsed:.2f}s')
+
+
 def main(config_path: str):
     # LOAD CONFIG
     with open(config_path) as config_json:
@@ -44,72 +166,175 @@ def main(config_path: str):
     console.log('Configuration read correctly', style='italic bold green')
     
     # LOAD DATABASE
+    configure_engine(config)
     create_db_and_tables()
     console.log('Database loaded', style='italic bold green')
+    enqueued = OutboxRepository().enqueue_unsent_postings()
+    if enqueued:
+        console.log(f'Queued {enqueued} unsent postings in the outbox')
+    load_known_shas(config.known_shas_snapshot)
+    known_listing_ids = load_known_listing_ids()
+    console.log(
+        f'Known postings index loaded ({len(known_shas)} shas, '
+        f'{len(known_listing_ids)} listing ids)'
+    )
+
+    parse_pool.configure(
+        workers=config.parse_workers,
+        min_pages=config.parse_pool_min_pages,
+    )
+    telegram_limiter.configure(
+        messages_per_second=config.telegram_messages_per_second,
+        chat_messages_per_minute=config.telegram_chat_messages_per_minute,
+    )
+    cassette.configure(
+        mode=config.cassette_mode,
+        directory=config.cassette_dir,
+        latency=config.cassette_latency,
+    )
+    rate_limiter.configure(
+        rate=config.requests_per_second_per_host,
+        max_rate=config.max_requests_per_second_per_host,
+        burst=config.request_burst_per_host,
+    )
+    response_cache.configure(
+        directory=config.http_cache_dir,
+        ttl=config.http_cache_ttl,
+        max_bytes=config.http_cache_max_mb * 1024 * 1024,
+    )
+
+    telegram_service = TelegramService(
+        bot_token=config.bot_token,
+        chat_room=config.chat_room,
+        pool_size=config.send_workers,
+    )
+    outbox_sender = OutboxSender(
+        telegram_service,
+        workers=config.send_workers,
+        claim_size=config.outbox_claim_size,
+        lease_seconds=config.outbox_lease_seconds,
+        max_attempts=config.outbox_max_attempts,
+        retry_backoff=config.outbox_retry_backoff,
+        poll_interval=config.outbox_poll_interval,
+        oldest_first=config.send_oldest_first,
+        digest_threshold=config.digest_backlog_threshold,
+        digest_claim_size=config.digest_claim_size,
+    )
+    if config.persist:
+        # Senders drain the outbox on their own while the loop scrapes
+        outbox_sender.start()
 
+    try:
+        run(config, outbox_sender)
+    finally:
+        outbox_sender.stop()
+        telegram_service.close()
+        session_pool.close()
+        parse_pool.close()
+        if config.known_shas_snapshot:
+            known_shas.save_snapshot(config.known_shas_snapshot)
+
+
+def run(config: Config, outbox_sender: OutboxSender):
     while(True):
         # SCRAP POSTINGS
+        posting_services = {}
         if config.zonaprop_full_url:
-            zonaprop_posting_service = PostingServiceFactory.build_for_zonaprop(
+            posting_services['Zonaprop'] = PostingServiceFactory.build_for_zonaprop(
                 pages=config.pages,
                 full_url=config.zonaprop_full_url,
+                concurrency=config.concurrent_requests_per_host,
+                fast_parse=config.fast_parse,
+                incremental=config.incremental_crawl,
+                full_crawl_interval=config.full_crawl_interval,
+                message_renderer=rendered_columns,
             )
-            zonaprop_posting_service.scrap_and_create_postings()
 
         if config.argenprop_full_url:
-            argenprop_posting_service = PostingServiceFactory.build_for_argenprop(
+            posting_services['Argenprop'] = PostingServiceFactory.build_for_argenprop(
                 pages=config.pages,
                 full_url=config.argenprop_full_url,
+                concurrency=config.concurrent_requests_per_host,
+                fast_parse=config.fast_parse,
+                incremental=config.incremental_crawl,
+                full_crawl_interval=config.full_crawl_interval,
+                message_renderer=rendered_columns,
             )
-            argenprop_posting_service.scrap_and_create_postings()
 
         if config.mercadolibre_full_url:
-            mercadolibre_posting_service = PostingServiceFactory.build_for_mercadolibre(
+            posting_services['Mercadolibre'] = PostingServiceFactory.build_for_mercadolibre(
                 pages=config.pages,
                 full_url=config.mercadolibre_full_url,
+                concurrency=config.concurrent_requests_per_host,
+                fast_parse=config.fast_parse,
+                incremental=config.incremental_crawl,
+                full_crawl_interval=config.full_crawl_interval,
+                message_renderer=rendered_columns,
             )
-            mercadolibre_posting_service.scrap_and_create_postings()
 
         if config.la_voz_full_url:
-            la_voz_posting_service = PostingServiceFactory.build_for_la_voz(
+            posting_services['La Voz'] = PostingServiceFactory.build_for_la_voz(
                 pages=config.pages,
                 full_url=config.la_voz_full_url,
+                concurrency=config.concurrent_requests_per_host,
+                fast_parse=config.fast_parse,
+                incremental=config.incremental_crawl,
+                full_crawl_interval=config.full_crawl_interval,
+                message_renderer=rendered_columns,
             )
-            la_voz_posting_service.scrap_and_create_postings()
 
         if config.properati_full_url:
-            properati_posting_service = PostingServiceFactory.build_for_properati(
+            posting_services['Properati'] = PostingServiceFactory.build_for_properati(
                 pages=config.pages,
                 full_url=config.properati_full_url,
+                concurrency=config.concurrent_requests_per_host,
+                fast_parse=config.fast_parse,
+                incremental=config.incremental_crawl,
+                full_crawl_interval=config.full_crawl_interval,
+                message_renderer=rendered_columns,
             )
-            properati_posting_service.scrap_and_create_postings()
 
+        scrape_in_parallel(posting_services, timeout=config.scrape_timeout)
         console.log('Postings scrapped', style='italic bold green')
+        session_stats = session_pool.stats()
+        console.log(
+            'Scraper sessions: {open} open, {reused} reused, {rebuilt} rebuilt'.format(
+                **session_stats
+            )
+        )
+        for host, host_stats in rate_limiter.stats().items():
+            console.log(
+                '{}: {rate:.2f} requests/s, throttled {throttled} times'.format(
+                    host, **host_stats
+                )
+            )
+        if response_cache.enabled:
+            console.log(
+                'Response cache: {revalidated} not modified, {unchanged} unchanged'.format(
+                    **response_cache.stats()
+                )
+            )
 
         # SEND POSTINGS
-        posting_repository = PostingRepository()
-        unsent_postings = posting_repository.get_unsent_postings()
-
-        telegram_service = TelegramService(
-            bot_token=config.bot_token,
-            chat_room=config.chat_room,
+        if not config.persist:
+            console.log('Sending queued postings')
+            outbox_sender.drain()
+        console.log(
+            'Outbox: {}; {} sent, {} failed attempts and {} worker errors so far'.format(
+                ', '.join(
+                    f'{count} {state}'
+                    for state, count in OutboxRepository().count_by_state().items()
+                ) or 'empty',
+                outbox_sender.sent,
+                outbox_sender.failed,
+                outbox_sender.errors,
+            )
         )
-        console.log(f'About to send [u]{len(unsent_postings)}[/u] postings')
-        for posting in track(unsent_postings, description='Sending postings...'):
-            # Try sending with automatic retries and backoff (respects Telegram's retry_after when detected)
-            ok = telegram_service.send_with_retries(posting, max_retries=3, backoff_base=2)
-            if ok:
-                posting_repository.set_posting_as_sent(posting.sha)
-            else:
-                console.log(
-                    (
-                        '[bold u]WARNING[/bold u]: '
-                        f'Unable to send {posting.title} after retries. '
-                        'It will be retried later automatically.'
-                    ),
-                    style='yellow'
-                )
-        console.log('Postings sent', style='italic bold green')
+        compacted = SendFailureRepository().compact_failures(
+            retention_days=config.send_failure_retention_days
+        )
+        if compacted:
+            console.log(f'Compacted {compacted} old send failures')
 
         if not config.persist:
             break
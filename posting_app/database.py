@@ -1,14 +1,23 @@
-from typing import Optional, List
+import datetime
+from typing import Callable, Dict, Iterable, Iterator, Optional, List, Set, Tuple
 
+from pydantic import BaseModel
+from sqlalchemy import delete, event, Index, inspect, text, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.engine import Engine
 from sqlmodel import (
     create_engine,
     Field,
+    func,
     select,
     Session,
     SQLModel,
 )
 from sqlmodel.sql.expression import Select, SelectOfScalar
 
+from .index import KnownListingIndex, KnownShaIndex
+from .records import ScrapedPosting
+
 # Avoiding a warning. More info at: 
 # https://github.com/tiangolo/sqlmodel/issues/189
 SelectOfScalar.inherit_cache = True
@@ -16,6 +25,15 @@ Select.inherit_cache = True
 
 
 class Posting(SQLModel, table=True):
+    __table_args__ = (
+        Index(
+            'ix_posting_source_listing_id',
+            'source',
+            'listing_id',
+            unique=True,
+        ),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     sha: str = Field(index=True, sa_column_kwargs={'unique': True})
     url: str = Field(sa_column_kwargs={'unique': True})
@@ -23,7 +41,14 @@ class Posting(SQLModel, table=True):
     price: Optional[str] = None
     location: Optional[str] = None
     description: Optional[str] = None
+    # Site name and the site's own numeric id, when it has one
+    source: Optional[str] = None
+    listing_id: Optional[int] = None
     sent: bool = Field(default=False, index=True)
+    # Telegram messages rendered on insert, see telegram_app.messages
+    message_full: Optional[str] = None
+    message_minimal: Optional[str] = None
+    message_version: Optional[int] = None
 
     def __key(self):
         return (self.id, self.sha)
@@ -37,25 +62,376 @@ class Posting(SQLModel, table=True):
         return NotImplemented
 
 
-engine = create_engine('sqlite:///scrapdep.db')
+class SearchCrawlState(SQLModel, table=True):
+    '''Where the last crawl of a search url stopped being new.'''
+    search_url: str = Field(primary_key=True)
+    # First posting of page 1 on the last crawl, newest-first sorting
+    high_water_sha: Optional[str] = None
+    last_full_crawl: Optional[datetime.datetime] = None
+
+    def full_crawl_due(self, interval: int) -> bool:
+        if self.last_full_crawl is None:
+            return True
+        elapsed = datetime.datetime.utcnow() - self.last_full_crawl
+        return elapsed.total_seconds() >= interval
+
+
+OUTBOX_PENDING = 'pending'
+OUTBOX_IN_FLIGHT = 'in_flight'
+OUTBOX_SENT = 'sent'
+OUTBOX_DEAD = 'dead'
+
+
+class OutboxMessage(SQLModel, table=True):
+    '''
+    A posting queued to be sent to Telegram. Pending and in-flight
+    messages can be claimed once `available_at` has passed: for pending
+    ones that's when the next attempt is due, for in-flight ones when
+    the lease of the worker that claimed it expires.
+
+    Messages point at the posting id, shas can be rewritten by the
+    maintenance scripts.
+    '''
+    id: Optional[int] = Field(default=None, primary_key=True)
+    posting_id: int = Field(foreign_key='posting.id', sa_column_kwargs={'unique': True})
+    state: str = Field(default=OUTBOX_PENDING, index=True)
+    attempts: int = 0
+    available_at: datetime.datetime = Field(
+        default_factory=datetime.datetime.utcnow, index=True
+    )
+    lease_owner: Optional[str] = None
+    last_error: Optional[str] = None
+    created_at: datetime.datetime = Field(
+        default_factory=datetime.datetime.utcnow
+    )
+    sent_at: Optional[datetime.datetime] = None
+
+
+class SendFailure(SQLModel, table=True):
+    '''A posting that couldn't be sent, with what Telegram answered.'''
+    id: Optional[int] = Field(default=None, primary_key=True)
+    sha: str = Field(index=True)
+    created_at: datetime.datetime = Field(
+        default_factory=datetime.datetime.utcnow, index=True
+    )
+    status_full: Optional[int] = None
+    status_minimal: Optional[int] = None
+    response_full: Optional[str] = None
+    response_minimal: Optional[str] = None
+    retry_after: Optional[int] = None
+
+
+class DatabaseConfig(BaseModel):
+    database_path: Optional[str] = 'scrapdep.db'
+    database_journal_mode: Optional[str] = 'wal'
+    database_synchronous: Optional[str] = 'normal'
+    # Negative values are KiB, positive values are pages
+    database_cache_size: Optional[int] = -20000
+    database_mmap_size: Optional[int] = 256 * 1024 * 1024
+    # Milliseconds a connection waits for a lock before "database is locked"
+    database_busy_timeout: Optional[int] = 30000
+    database_pool_size: Optional[int] = 5
+    database_max_overflow: Optional[int] = 10
+
+
+def build_engine(config: DatabaseConfig) -> Engine:
+    '''Creates the SQLite engine applying the pragmas in `config`.'''
+    new_engine = create_engine(
+        'sqlite:///{}'.format(config.database_path),
+        connect_args={
+            'check_same_thread': False,
+            'timeout': config.database_busy_timeout / 1000,
+        },
+        pool_size=config.database_pool_size,
+        max_overflow=config.database_max_overflow,
+    )
+
+    @event.listens_for(new_engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f'PRAGMA journal_mode={config.database_journal_mode}')
+        cursor.execute(f'PRAGMA synchronous={config.database_synchronous}')
+        cursor.execute(f'PRAGMA cache_size={config.database_cache_size:d}')
+        cursor.execute(f'PRAGMA mmap_size={config.database_mmap_size:d}')
+        cursor.execute(f'PRAGMA busy_timeout={config.database_busy_timeout:d}')
+        cursor.close()
+
+    return new_engine
+
+
+def configure_engine(config: DatabaseConfig) -> Engine:
+    '''
+    Replaces the module engine. Use `database.engine` after calling
+    this instead of a name imported before.
+    '''
+    global engine
+    engine.dispose()
+    engine = build_engine(config)
+    return engine
+
+
+engine = build_engine(DatabaseConfig())
+
+# SQLite caps the amount of bound parameters per statement
+SQLITE_MAX_VARIABLES = 900
+
+known_shas = KnownShaIndex()
+known_listing_ids = KnownListingIndex()
 
 
 def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
+    add_listing_id_columns()
+    add_message_columns()
+    key_outbox_by_posting_id()
+    create_dead_letter_view()
+
+
+def add_message_columns():
+    '''
+    Adds the pre-rendered message columns to databases created before
+    they existed. Old postings get their messages rendered when sent.
+    '''
+    columns = {column['name'] for column in inspect(engine).get_columns('posting')}
+    if 'message_version' in columns:
+        return
+
+    with engine.begin() as connection:
+        connection.execute(text('ALTER TABLE posting ADD COLUMN message_full VARCHAR'))
+        connection.execute(text('ALTER TABLE posting ADD COLUMN message_minimal VARCHAR'))
+        connection.execute(text('ALTER TABLE posting ADD COLUMN message_version INTEGER'))
+
+
+def key_outbox_by_posting_id():
+    '''
+    Rebuilds the outbox of databases where it was keyed by sha. Queued
+    messages whose sha no longer matches a posting are dropped, their
+    postings are queued again on start if they are still unsent.
+    '''
+    columns = {
+        column['name'] for column in inspect(engine).get_columns('outboxmessage')
+    }
+    if 'posting_id' in columns:
+        return
+
+    with engine.begin() as connection:
+        connection.execute(text('DROP VIEW IF EXISTS outbox_dead_letter'))
+        connection.execute(text('ALTER TABLE outboxmessage RENAME TO outboxmessage_by_sha'))
+        # Index names are global in SQLite, the new table needs them
+        for index in OutboxMessage.__table__.indexes:
+            connection.execute(text('DROP INDEX IF EXISTS {}'.format(index.name)))
+        OutboxMessage.__table__.create(connection)
+        connection.execute(text(
+            'INSERT INTO outboxmessage (id, posting_id, state, attempts, '
+            'available_at, lease_owner, last_error, created_at, sent_at) '
+            'SELECT old.id, posting.id, old.state, old.attempts, '
+            'old.available_at, old.lease_owner, old.last_error, old.created_at, '
+            'old.sent_at FROM outboxmessage_by_sha AS old '
+            'JOIN posting ON posting.sha = old.sha'
+        ))
+        connection.execute(text('DROP TABLE outboxmessage_by_sha'))
+
+
+def create_dead_letter_view():
+    '''
+    `outbox_dead_letter` lists the postings that gave up being sent.
+    Messages whose posting was deleted show up with no url or title.
+    '''
+    with engine.begin() as connection:
+        connection.execute(text('DROP VIEW IF EXISTS outbox_dead_letter'))
+        connection.execute(text(
+            'CREATE VIEW outbox_dead_letter AS '
+            'SELECT outboxmessage.id, outboxmessage.posting_id, posting.sha, '
+            'posting.url, posting.title, outboxmessage.attempts, '
+            'outboxmessage.last_error, outboxmessage.available_at AS died_at '
+            'FROM outboxmessage '
+            'LEFT JOIN posting ON posting.id = outboxmessage.posting_id '
+            "WHERE outboxmessage.state = 'dead'"
+        ))
+
+
+def add_listing_id_columns():
+    '''
+    Adds the `source`/`listing_id` columns to databases created before
+    they existed. Fill them for old postings with
+    `scripts/backfill_listing_ids.py`.
+    '''
+    columns = {column['name'] for column in inspect(engine).get_columns('posting')}
+    if 'listing_id' in columns:
+        return
+
+    with engine.begin() as connection:
+        connection.execute(text('ALTER TABLE posting ADD COLUMN source VARCHAR'))
+        connection.execute(text('ALTER TABLE posting ADD COLUMN listing_id INTEGER'))
+    for index in Posting.__table__.indexes:
+        if index.name == 'ix_posting_source_listing_id':
+            index.create(engine, checkfirst=True)
+
+
+def load_known_listing_ids() -> KnownListingIndex:
+    known_listing_ids.clear()
+    with Session(engine) as session:
+        statement = select(Posting.source, Posting.listing_id).where(
+            Posting.listing_id != None
+        )
+        known_listing_ids.update(session.exec(statement))
+
+    return known_listing_ids
+
+
+def load_known_shas(snapshot_path: Optional[str] = None) -> KnownShaIndex:
+    '''
+    Fills `known_shas` from the snapshot at `snapshot_path` plus the
+    postings inserted after it was written. Falls back to reading
+    every sha from the database when the snapshot is missing or
+    doesn't match the table anymore (e.g. rows were deleted).
+    '''
+    with Session(engine) as session:
+        if snapshot_path and known_shas.open_snapshot(snapshot_path):
+            statement = select(Posting.id, Posting.sha).where(
+                Posting.id > known_shas.max_id
+            )
+            newer = session.exec(statement).all()
+            known_shas.update(
+                known_shas.unknown(sha for _, sha in newer),
+                max_id=max((_id for _id, _ in newer), default=0),
+            )
+            total = session.exec(select(func.count(Posting.id))).one()
+            if total == len(known_shas):
+                return known_shas
+
+        known_shas.clear()
+        rows = session.exec(select(Posting.id, Posting.sha)).all()
+        known_shas.update(
+            (sha for _, sha in rows),
+            max_id=max((_id for _id, _ in rows), default=0),
+        )
+
+    if snapshot_path:
+        known_shas.save_snapshot(snapshot_path)
+
+    return known_shas
 
 
 class PostingRepository:
     def create_posting(self, posting: Posting):
         with Session(engine) as session:
             session.add(posting)
+            if not posting.sent:
+                session.flush()
+                session.add(OutboxMessage(posting_id=posting.id))
+            session.commit()
+            known_shas.add(posting.sha, posting.id)
+
+    def create_postings(
+        self,
+        postings: Iterable[ScrapedPosting],
+    ) -> Tuple[int, int]:
+        '''
+        Inserts every posting in a single transaction, skipping the ones
+        whose sha or url is already stored. Returns the amount of
+        inserted and skipped postings.
+        '''
+        postings = list(postings)
+        inserted = self.insert_postings(postings)
+        return len(inserted), len(postings) - len(inserted)
+
+    def insert_postings(
+        self,
+        postings: Iterable[ScrapedPosting],
+        message_renderer: Optional[Callable[[ScrapedPosting], Dict]] = None,
+    ) -> List[Posting]:
+        '''
+        Same as `create_postings` but returns the inserted ones as
+        `Posting` rows with their ids set. Only these get turned into
+        ORM objects. They're queued in the outbox in the same
+        transaction.
+
+        `message_renderer` returns the message columns of a posting
+        (see `telegram_app.messages.rendered_columns`). When given, the
+        inserted postings are stored with their messages rendered, the
+        skipped ones aren't rendered at all.
+        '''
+        postings = {posting.sha: posting for posting in postings}
+        rows = {sha: posting.as_row() for sha, posting in postings.items()}
+        if not rows:
+            return []
+
+        statement = (
+            insert(Posting)
+            .on_conflict_do_nothing()
+            .returning(Posting.id, Posting.sha)
+        )
+        with Session(engine) as session:
+            inserted_rows = session.execute(statement, list(rows.values())).all()
+            if inserted_rows:
+                session.execute(
+                    insert(OutboxMessage).on_conflict_do_nothing(),
+                    [{'posting_id': _id} for _id, _ in inserted_rows],
+                )
+            if inserted_rows and message_renderer is not None:
+                messages = []
+                for _id, sha in inserted_rows:
+                    columns = message_renderer(postings[sha])
+                    rows[sha].update(columns)
+                    messages.append(dict(columns, id=_id))
+                session.execute(update(Posting), messages)
             session.commit()
 
+        known_shas.update(
+            (sha for _, sha in inserted_rows),
+            max_id=max((_id for _id, _ in inserted_rows), default=0),
+        )
+        known_listing_ids.update(
+            (rows[sha]['source'], rows[sha]['listing_id'])
+            for _, sha in inserted_rows
+            if rows[sha]['listing_id'] is not None
+        )
+        return [Posting(id=_id, **rows[sha]) for _id, sha in inserted_rows]
+
     def get_posting_by_sha(self, sha: str) -> Optional[Posting]:
         with Session(engine) as session:
             statement = select(Posting).where(Posting.sha == sha)
             posting = session.exec(statement).first()
 
             return posting
+
+    def get_existing_shas(self, shas: Iterable[str]) -> Set[str]:
+        '''Returns which of the given shas are already stored.'''
+        shas = list(set(shas))
+        existing = set()
+        with Session(engine) as session:
+            for start in range(0, len(shas), SQLITE_MAX_VARIABLES):
+                chunk = shas[start:start + SQLITE_MAX_VARIABLES]
+                statement = select(Posting.sha).where(Posting.sha.in_(chunk))
+                existing.update(session.exec(statement))
+
+        return existing
+    
+    def get_existing_listing_keys(
+        self,
+        keys: Iterable[Tuple[str, int]],
+    ) -> Set[Tuple[str, int]]:
+        '''Returns which of the given (source, listing_id) are already stored.'''
+        ids_by_source = {}
+        for source, listing_id in set(keys):
+            ids_by_source.setdefault(source, []).append(listing_id)
+
+        existing = set()
+        with Session(engine) as session:
+            for source, ids in ids_by_source.items():
+                for start in range(0, len(ids), SQLITE_MAX_VARIABLES):
+                    chunk = ids[start:start + SQLITE_MAX_VARIABLES]
+                    statement = select(Posting.source, Posting.listing_id).where(
+                        Posting.source == source,
+                        Posting.listing_id.in_(chunk),
+                    )
+                    existing.update(
+                        (row_source, row_id)
+                        for row_source, row_id in session.exec(statement)
+                    )
+
+        return existing
     
     def get_unsent_postings(self) -> List[Posting]:
         with Session(engine) as session:
@@ -67,10 +443,424 @@ class PostingRepository:
 
             return postings
 
+    def iter_unsent_postings(
+        self,
+        batch_size: int = 100,
+        oldest_first: bool = True,
+    ) -> Iterator[Posting]:
+        '''
+        Yields unsent postings paging by id, so only `batch_size` rows
+        are loaded at a time. Rows marked as sent while iterating don't
+        shift the pages.
+        '''
+        last_id = None
+        while True:
+            statement = select(Posting).where(Posting.sent == False)
+            if oldest_first:
+                if last_id is not None:
+                    statement = statement.where(Posting.id > last_id)
+                statement = statement.order_by(Posting.id)
+            else:
+                if last_id is not None:
+                    statement = statement.where(Posting.id < last_id)
+                statement = statement.order_by(Posting.id.desc())
+
+            with Session(engine) as session:
+                postings = session.exec(statement.limit(batch_size)).all()
+
+            yield from postings
+            if len(postings) < batch_size:
+                return
+            last_id = postings[-1].id
+
+    def count_unsent(self) -> int:
+        with Session(engine) as session:
+            statement = select(func.count(Posting.id)).where(Posting.sent == False)
+            return session.exec(statement).one()
+
+    def set_postings_as_sent(self, shas: Iterable[str]):
+        shas = list(shas)
+        with Session(engine) as session:
+            for start in range(0, len(shas), SQLITE_MAX_VARIABLES):
+                chunk = shas[start:start + SQLITE_MAX_VARIABLES]
+                statement = (
+                    update(Posting)
+                    .where(Posting.sha.in_(chunk))
+                    .values(sent=True)
+                )
+                session.execute(statement)
+                session.execute(
+                    update(OutboxMessage)
+                    .where(
+                        OutboxMessage.posting_id.in_(
+                            select(Posting.id).where(Posting.sha.in_(chunk))
+                        )
+                    )
+                    .values(
+                        state=OUTBOX_SENT,
+                        sent_at=datetime.datetime.utcnow(),
+                        lease_owner=None,
+                    )
+                )
+            session.commit()
+
     def set_posting_as_sent(self, sha: str):
+        self.set_postings_as_sent([sha])
+
+    def set_messages(self, sha: str, messages: Dict):
+        '''Stores messages rendered again with the current templates.'''
         with Session(engine) as session:
-            statement = select(Posting).where(Posting.sha == sha)
-            posting = session.exec(statement).first()
-            posting.sent = True
-            session.add(posting)
+            session.execute(
+                update(Posting).where(Posting.sha == sha).values(**messages)
+            )
+            session.commit()
+
+
+def _ids_by_owner(messages: Iterable[OutboxMessage]) -> Dict[str, List[int]]:
+    ids_by_owner: Dict[str, List[int]] = {}
+    for message in messages:
+        ids_by_owner.setdefault(message.lease_owner, []).append(message.id)
+    return ids_by_owner
+
+
+class OutboxRepository:
+    def enqueue_unsent_postings(self) -> int:
+        '''
+        Queues the unsent postings that aren't in the outbox yet, e.g.
+        the ones stored before it existed. Returns how many were queued.
+        '''
+        queued = select(OutboxMessage.posting_id)
+        statement = (
+            insert(OutboxMessage)
+            .from_select(
+                ['posting_id'],
+                select(Posting.id)
+                .where(Posting.sent == False)
+                .where(Posting.id.not_in(queued))
+                .order_by(Posting.id),
+            )
+            .on_conflict_do_nothing()
+        )
+        with Session(engine) as session:
+            queued_count = session.execute(statement).rowcount
+            session.commit()
+
+        return queued_count
+
+    def claim_messages(
+        self,
+        owner: str,
+        limit: int = 10,
+        lease_seconds: int = 300,
+        oldest_first: bool = True,
+    ) -> List[Tuple[OutboxMessage, Posting]]:
+        '''
+        Leases up to `limit` claimable messages to `owner` and returns
+        them with their postings. The select and the update run in a
+        single statement, so concurrent workers never get the same one.
+
+        Claimable messages whose posting is already sent (e.g. marked
+        as a duplicate) are settled as sent first, and the ones whose
+        posting no longer exists are moved to the dead letters.
+        '''
+        now = datetime.datetime.utcnow()
+        claimable = (
+            select(OutboxMessage.id)
+            .join(Posting, Posting.id == OutboxMessage.posting_id)
+            .where(OutboxMessage.state.in_([OUTBOX_PENDING, OUTBOX_IN_FLIGHT]))
+            .where(OutboxMessage.available_at <= now)
+            .where(Posting.sent == False)
+            .order_by(
+                OutboxMessage.id if oldest_first else OutboxMessage.id.desc()
+            )
+            .limit(limit)
+        )
+        statement = (
+            update(OutboxMessage)
+            .where(OutboxMessage.id.in_(claimable))
+            .values(
+                state=OUTBOX_IN_FLIGHT,
+                attempts=OutboxMessage.attempts + 1,
+                lease_owner=owner,
+                available_at=now + datetime.timedelta(seconds=lease_seconds),
+            )
+            .returning(
+                OutboxMessage.id, OutboxMessage.posting_id, OutboxMessage.attempts
+            )
+        )
+        with Session(engine) as session:
+            self._settle_claimable(session, now)
+            messages = [
+                OutboxMessage(
+                    id=_id,
+                    posting_id=posting_id,
+                    attempts=attempts,
+                    state=OUTBOX_IN_FLIGHT,
+                    lease_owner=owner,
+                )
+                for _id, posting_id, attempts in session.execute(statement).all()
+            ]
+            session.commit()
+            if not messages:
+                return []
+            postings = {
+                posting.id: posting
+                for posting in session.exec(
+                    select(Posting).where(
+                        Posting.id.in_([message.posting_id for message in messages])
+                    )
+                )
+            }
+
+        messages.sort(key=lambda message: message.id, reverse=not oldest_first)
+        return [
+            (message, postings[message.posting_id])
+            for message in messages
+            if message.posting_id in postings
+        ]
+
+    def _settle_claimable(self, session: Session, now: datetime.datetime):
+        claimable = (
+            OutboxMessage.state.in_([OUTBOX_PENDING, OUTBOX_IN_FLIGHT])
+            & (OutboxMessage.available_at <= now)
+        )
+        session.execute(
+            update(OutboxMessage)
+            .where(claimable)
+            .where(
+                OutboxMessage.posting_id.in_(
+                    select(Posting.id).where(Posting.sent == True)
+                )
+            )
+            .values(state=OUTBOX_SENT, lease_owner=None)
+        )
+        session.execute(
+            update(OutboxMessage)
+            .where(claimable)
+            .where(OutboxMessage.posting_id.not_in(select(Posting.id)))
+            .values(
+                state=OUTBOX_DEAD,
+                lease_owner=None,
+                last_error='posting no longer exists',
+            )
+        )
+
+    def renew_leases(
+        self,
+        messages: Iterable[OutboxMessage],
+        lease_seconds: int = 300,
+    ) -> Set[int]:
+        '''
+        Extends the lease of the messages still held by their owner and
+        returns their ids. The rest were claimed by another worker after
+        the lease expired and must not be sent.
+        '''
+        expires_at = datetime.datetime.utcnow() + datetime.timedelta(
+            seconds=lease_seconds
+        )
+        with Session(engine) as session:
+            held = {
+                _id
+                for owner, ids in _ids_by_owner(messages).items()
+                for _id in session.execute(
+                    update(OutboxMessage)
+                    .where(OutboxMessage.id.in_(ids))
+                    .where(OutboxMessage.lease_owner == owner)
+                    .where(OutboxMessage.state == OUTBOX_IN_FLIGHT)
+                    .values(available_at=expires_at)
+                    .returning(OutboxMessage.id)
+                ).scalars()
+            }
+            session.commit()
+
+        return held
+
+    def mark_sent(self, message: OutboxMessage) -> int:
+        return self.mark_many_sent([message])
+
+    def mark_many_sent(self, messages: Iterable[OutboxMessage]) -> int:
+        '''
+        Marks the messages and their postings as sent, as long as the
+        messages are still leased to their owner. Returns how many were.
+        '''
+        now = datetime.datetime.utcnow()
+        marked = 0
+        with Session(engine) as session:
+            for owner, ids in _ids_by_owner(messages).items():
+                posting_ids = session.execute(
+                    update(OutboxMessage)
+                    .where(OutboxMessage.id.in_(ids))
+                    .where(OutboxMessage.lease_owner == owner)
+                    .where(OutboxMessage.state == OUTBOX_IN_FLIGHT)
+                    .values(state=OUTBOX_SENT, sent_at=now, lease_owner=None)
+                    .returning(OutboxMessage.posting_id)
+                ).scalars().all()
+                if posting_ids:
+                    session.execute(
+                        update(Posting)
+                        .where(Posting.id.in_(posting_ids))
+                        .values(sent=True)
+                    )
+                marked += len(posting_ids)
+            session.commit()
+
+        return marked
+
+    def mark_failed(
+        self,
+        message: OutboxMessage,
+        error: Optional[str],
+        retry_in: Optional[float] = None,
+    ):
+        '''
+        Puts the message back as pending, due in `retry_in` seconds, or
+        moves it to the dead letters when `retry_in` is None.
+        '''
+        now = datetime.datetime.utcnow()
+        values = {'last_error': error, 'lease_owner': None}
+        if retry_in is None:
+            values.update(state=OUTBOX_DEAD, available_at=now)
+        else:
+            values.update(
+                state=OUTBOX_PENDING,
+                available_at=now + datetime.timedelta(seconds=retry_in),
+            )
+        with Session(engine) as session:
+            session.execute(
+                update(OutboxMessage)
+                .where(OutboxMessage.id == message.id)
+                .where(OutboxMessage.lease_owner == message.lease_owner)
+                .values(**values)
+            )
+            session.commit()
+
+    def count_due(self) -> int:
+        '''Messages that could be claimed right now, i.e. the backlog.'''
+        now = datetime.datetime.utcnow()
+        with Session(engine) as session:
+            statement = (
+                select(func.count(OutboxMessage.id))
+                .join(Posting, Posting.id == OutboxMessage.posting_id)
+                .where(OutboxMessage.state.in_([OUTBOX_PENDING, OUTBOX_IN_FLIGHT]))
+                .where(OutboxMessage.available_at <= now)
+                .where(Posting.sent == False)
+            )
+            return session.exec(statement).one()
+
+    def count_by_state(self) -> Dict[str, int]:
+        with Session(engine) as session:
+            statement = select(
+                OutboxMessage.state, func.count(OutboxMessage.id)
+            ).group_by(OutboxMessage.state)
+            return dict(session.exec(statement).all())
+
+    def get_dead_letters(self, limit: int = 50) -> List[Dict]:
+        with Session(engine) as session:
+            rows = session.execute(
+                text('SELECT * FROM outbox_dead_letter ORDER BY id DESC LIMIT :limit'),
+                {'limit': limit},
+            )
+            return [dict(row._mapping) for row in rows]
+
+    def discard_postings(self, posting_ids: Iterable[int]) -> int:
+        '''
+        Marks postings as sent without sending them (e.g. duplicates)
+        and settles their queued messages, `sent_at` stays empty.
+        Returns how many postings were marked.
+        '''
+        posting_ids = list(posting_ids)
+        discarded = 0
+        with Session(engine) as session:
+            for start in range(0, len(posting_ids), SQLITE_MAX_VARIABLES):
+                chunk = posting_ids[start:start + SQLITE_MAX_VARIABLES]
+                discarded += session.execute(
+                    update(Posting)
+                    .where(Posting.id.in_(chunk))
+                    .where(Posting.sent == False)
+                    .values(sent=True)
+                ).rowcount
+                session.execute(
+                    update(OutboxMessage)
+                    .where(OutboxMessage.posting_id.in_(chunk))
+                    .where(OutboxMessage.state.in_([OUTBOX_PENDING, OUTBOX_IN_FLIGHT]))
+                    .values(state=OUTBOX_SENT, lease_owner=None)
+                )
+            session.commit()
+
+        return discarded
+
+    def requeue_dead(self) -> int:
+        '''Gives every dead message a fresh set of attempts.'''
+        with Session(engine) as session:
+            requeued = session.execute(
+                update(OutboxMessage)
+                .where(OutboxMessage.state == OUTBOX_DEAD)
+                .values(
+                    state=OUTBOX_PENDING,
+                    attempts=0,
+                    available_at=datetime.datetime.utcnow(),
+                )
+            ).rowcount
+            session.commit()
+
+        return requeued
+
+
+class SearchCrawlStateRepository:
+    def get_crawl_state(self, search_url: str) -> SearchCrawlState:
+        with Session(engine) as session:
+            crawl_state = session.get(SearchCrawlState, search_url)
+
+        return crawl_state or SearchCrawlState(search_url=search_url)
+
+    def save_crawl_state(self, crawl_state: SearchCrawlState):
+        with Session(engine) as session:
+            session.merge(crawl_state)
+            session.commit()
+
+
+class SendFailureRepository:
+    def add_failure(self, failure: SendFailure):
+        with Session(engine) as session:
+            session.add(failure)
             session.commit()
+
+    def get_recent_failures(self, limit: int = 5) -> List[SendFailure]:
+        with Session(engine) as session:
+            statement = (
+                select(SendFailure)
+                .order_by(SendFailure.id.desc())
+                .limit(limit)
+            )
+            return session.exec(statement).all()
+
+    def get_failures(self, sha: str) -> List[SendFailure]:
+        with Session(engine) as session:
+            statement = (
+                select(SendFailure)
+                .where(SendFailure.sha == sha)
+                .order_by(SendFailure.id)
+            )
+            return session.exec(statement).all()
+
+    def compact_failures(self, retention_days: int = 30) -> int:
+        '''
+        Deletes the failures older than `retention_days`, the ones of
+        postings that were sent afterwards and all but the latest one
+        of every other posting. Returns the amount of deleted rows.
+        '''
+        expired_before = (
+            datetime.datetime.utcnow() - datetime.timedelta(days=retention_days)
+        )
+        sent_shas = select(Posting.sha).where(Posting.sent == True)
+        latest_ids = select(func.max(SendFailure.id)).group_by(SendFailure.sha)
+        statement = delete(SendFailure).where(
+            (SendFailure.created_at < expired_before)
+            | SendFailure.sha.in_(sent_shas)
+            | SendFailure.id.not_in(latest_ids)
+        )
+        with Session(engine) as session:
+            deleted = session.execute(statement).rowcount
+            session.commit()
+
+        return deleted
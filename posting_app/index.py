@@ -0,0 +1,247 @@
+import heapq
+import mmap
+import os
+import struct
+from threading import Lock
+from typing import Dict, Iterable, Iterator, Optional, Set, Tuple
+
+SNAPSHOT_MAGIC = b'KSHA1\x00\x00\x00'
+# magic, highest posting id included, amount of digests
+SNAPSHOT_HEADER = struct.Struct('<8sQQ')
+DIGEST_SIZE = 20
+
+
+class KnownShaIndex:
+    '''
+    In-memory index of the shas already stored in the `posting` table.
+
+    Membership is exact (no false positives): shas live in a set, and
+    the ones loaded from a snapshot stay in a memory-mapped file of
+    sorted SHA1 digests that is binary searched. Shas not in the index
+    are still checked against the database by the caller. Snapshot
+    lookups hold the lock, so the mapping is never closed under them.
+    '''
+
+    def __init__(self):
+        self._shas: Set[str] = set()
+        self._lock = Lock()
+        self._snapshot = None
+        self._snapshot_file = None
+        self._snapshot_path: Optional[str] = None
+        self._snapshot_count = 0
+        self.max_id = 0
+        self.loaded = False
+
+    def __contains__(self, sha: str) -> bool:
+        if sha in self._shas:
+            return True
+        with self._lock:
+            return self._in_snapshot(sha)
+
+    def __len__(self) -> int:
+        return self._snapshot_count + len(self._shas)
+
+    def add(self, sha: str, posting_id: Optional[int] = None):
+        with self._lock:
+            self._shas.add(sha)
+            if posting_id and posting_id > self.max_id:
+                self.max_id = posting_id
+
+    def update(self, shas: Iterable[str], max_id: Optional[int] = None):
+        with self._lock:
+            self._shas.update(shas)
+            if max_id and max_id > self.max_id:
+                self.max_id = max_id
+            self.loaded = True
+
+    def clear(self):
+        with self._lock:
+            self._close_snapshot()
+            self._shas = set()
+            self.max_id = 0
+            self.loaded = False
+
+    def unknown(self, shas: Iterable[str]) -> Set[str]:
+        '''Returns the shas that are not in the index.'''
+        with self._lock:
+            return {
+                sha for sha in shas
+                if sha not in self._shas and not self._in_snapshot(sha)
+            }
+
+    def open_snapshot(self, path: str) -> bool:
+        '''
+        Maps a snapshot written by `save_snapshot`, in place of the
+        current one. Returns False when there is no usable snapshot at
+        `path`.
+        '''
+        mapped = _map_snapshot(path)
+        if mapped is None:
+            return False
+
+        with self._lock:
+            self._close_snapshot()
+            self._set_snapshot(*mapped)
+            self.loaded = True
+
+        return True
+
+    def save_snapshot(self, path: str):
+        '''
+        Writes every hex SHA1 in the index to `path` as sorted binary
+        digests, merging the current snapshot with the set as it goes
+        so neither is copied into memory. Other shas are kept in memory
+        only and reloaded from the database on the next start.
+        '''
+        with self._lock:
+            pending = sorted(filter(None, map(_to_digest, self._shas)))
+            snapshot_path = self._snapshot_path
+            max_id = self.max_id
+
+        tmp_path = '{}.tmp'.format(path)
+        count = 0
+        with open(tmp_path, 'wb') as fh:
+            fh.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, max_id, 0))
+            previous = None
+            for digest in heapq.merge(_read_digests(snapshot_path), pending):
+                if digest != previous:
+                    fh.write(digest)
+                    count += 1
+                    previous = digest
+            fh.seek(0)
+            fh.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, max_id, count))
+
+        mapped = _map_snapshot(tmp_path)
+        written = set(pending)
+        with self._lock:
+            self._close_snapshot()
+            os.replace(tmp_path, path)
+            self._set_snapshot(*mapped)
+            self._snapshot_path = path
+            # Whatever is in the snapshot now doesn't need to live in the set
+            self._shas = {
+                sha for sha in self._shas if _to_digest(sha) not in written
+            }
+
+    def close(self):
+        '''Unmaps the snapshot, the shas in it are no longer known.'''
+        with self._lock:
+            self._close_snapshot()
+
+    def _set_snapshot(self, snapshot_file, snapshot, max_id: int, count: int):
+        self._snapshot_file = snapshot_file
+        self._snapshot_path = snapshot_file.name
+        self._snapshot = snapshot
+        self._snapshot_count = count
+        self.max_id = max(self.max_id, max_id)
+
+    def _close_snapshot(self):
+        if self._snapshot is not None:
+            self._snapshot.close()
+        if self._snapshot_file is not None:
+            self._snapshot_file.close()
+        self._snapshot = None
+        self._snapshot_file = None
+        self._snapshot_path = None
+        self._snapshot_count = 0
+
+    def _in_snapshot(self, sha: str) -> bool:
+        snapshot = self._snapshot
+        digest = _to_digest(sha)
+        if snapshot is None or digest is None:
+            return False
+
+        low, high = 0, self._snapshot_count
+        while low < high:
+            middle = (low + high) // 2
+            start = SNAPSHOT_HEADER.size + middle * DIGEST_SIZE
+            current = snapshot[start:start + DIGEST_SIZE]
+            if current < digest:
+                low = middle + 1
+            elif current > digest:
+                high = middle
+            else:
+                return True
+
+        return False
+
+
+class KnownListingIndex:
+    '''
+    In-memory index of the site listing ids already stored, kept as a
+    set of integers per source.
+    '''
+
+    def __init__(self):
+        self._ids: Dict[str, Set[int]] = {}
+        self._lock = Lock()
+
+    def __contains__(self, key: Optional[Tuple[str, int]]) -> bool:
+        if key is None:
+            return False
+        source, listing_id = key
+        return listing_id in self._ids.get(source, ())
+
+    def __len__(self) -> int:
+        return sum(len(ids) for ids in self._ids.values())
+
+    def update(self, keys: Iterable[Tuple[str, int]]):
+        with self._lock:
+            for source, listing_id in keys:
+                self._ids.setdefault(source, set()).add(listing_id)
+
+    def clear(self):
+        with self._lock:
+            self._ids = {}
+
+
+def _to_digest(sha: str) -> Optional[bytes]:
+    # Only lowercase hex round-trips exactly through bytes.hex()
+    if len(sha) != DIGEST_SIZE * 2 or sha != sha.lower():
+        return None
+    try:
+        return bytes.fromhex(sha)
+    except ValueError:
+        return None
+
+
+def _map_snapshot(path: str):
+    '''
+    Opens and maps a snapshot, returns (file, mmap, max_id, count) or
+    None when there is no valid snapshot at `path`.
+    '''
+    if not os.path.exists(path):
+        return None
+
+    snapshot_file = open(path, 'rb')
+    try:
+        header = snapshot_file.read(SNAPSHOT_HEADER.size)
+        magic, max_id, count = SNAPSHOT_HEADER.unpack(header)
+        expected_size = SNAPSHOT_HEADER.size + count * DIGEST_SIZE
+        if magic != SNAPSHOT_MAGIC or os.path.getsize(path) != expected_size:
+            raise ValueError('Invalid known shas snapshot')
+        snapshot = None
+        if count:
+            snapshot = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (struct.error, ValueError):
+        snapshot_file.close()
+        return None
+
+    return snapshot_file, snapshot, max_id, count
+
+
+def _read_digests(path: Optional[str], chunk_digests: int = 4096) -> Iterator[bytes]:
+    '''
+    Streams the sorted digests of the snapshot at `path` through its own
+    file handle, the index keeps answering lookups from its mapping.
+    '''
+    if path is None:
+        return
+    with open(path, 'rb') as fh:
+        fh.seek(SNAPSHOT_HEADER.size)
+        while True:
+            chunk = fh.read(chunk_digests * DIGEST_SIZE)
+            if not chunk:
+                return
+            for start in range(0, len(chunk), DIGEST_SIZE):
+                yield chunk[start:start + DIGEST_SIZE]
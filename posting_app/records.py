@@ -0,0 +1,74 @@
+from typing import Dict, Optional, Tuple
+
+
+class ScrapedPosting:
+    '''
+    Lightweight record for a posting read from a listing page.
+
+    Most scraped cards are duplicates that get thrown away, so the
+    pipeline carries these slotted records instead of SQLModel
+    instances, and only the inserted ones become `Posting` rows.
+    Two records are the same posting when their shas match.
+    '''
+    __slots__ = (
+        'sha',
+        'url',
+        'title',
+        'price',
+        'location',
+        'description',
+        'source',
+        'listing_id',
+    )
+
+    def __init__(
+        self,
+        sha: str,
+        url: str,
+        title: Optional[str] = None,
+        price: Optional[str] = None,
+        location: Optional[str] = None,
+        description: Optional[str] = None,
+        source: Optional[str] = None,
+        listing_id: Optional[int] = None,
+    ):
+        self.sha = sha
+        self.url = url
+        self.title = title
+        self.price = price
+        self.location = location
+        self.description = description
+        self.source = source
+        self.listing_id = listing_id
+
+    def __hash__(self):
+        return hash(self.sha)
+
+    def __eq__(self, other):
+        if isinstance(other, ScrapedPosting):
+            return self.sha == other.sha
+        return NotImplemented
+
+    def __repr__(self):
+        return 'ScrapedPosting(sha={!r}, url={!r})'.format(self.sha, self.url)
+
+    @property
+    def listing_key(self) -> Optional[Tuple[str, int]]:
+        '''The site's own id for the listing, when the site has a stable one.'''
+        if self.source and self.listing_id is not None:
+            return self.source, self.listing_id
+        return None
+
+    def as_row(self) -> Dict:
+        '''Column values for inserting the posting as unsent.'''
+        return {
+            'sha': self.sha,
+            'url': self.url,
+            'title': self.title,
+            'price': self.price,
+            'location': self.location,
+            'description': self.description,
+            'source': self.source,
+            'listing_id': self.listing_id,
+            'sent': False,
+        }
@@ -1,23 +1,49 @@
+from typing import Callable, Dict, Optional, Tuple
+
 from rich.console import Console
 
 from .database import PostingRepository
+from .records import ScrapedPosting
 from scraper_app.services import ScraperService, ScraperServiceFactory
 
 console = Console()
 
 
 class PostingService:
-    def __init__(self, scraper_service: ScraperService):
+    def __init__(
+        self,
+        scraper_service: ScraperService,
+        message_renderer: Optional[Callable[[ScrapedPosting], Dict]] = None,
+    ):
         self._scraper_service = scraper_service
+        self._message_renderer = message_renderer
     
-    def scrap_and_create_postings(self):
-        postings = self._scraper_service.get_postings_from_scraper()
+    def scrap_and_create_postings(self) -> Tuple[int, int]:
+        '''
+        Saves the new postings of each page as soon as the page is
+        parsed. The inserted ones are stored with the messages rendered
+        by `message_renderer`, if any.
+        '''
         posting_repository = PostingRepository()
+        inserted, skipped = 0, 0
+
+        for postings in self._scraper_service.iter_postings():
+            if not postings:
+                continue
+
+            console.log(f'About to save {len(postings)} postings')
+            new_postings = posting_repository.insert_postings(
+                postings, message_renderer=self._message_renderer
+            )
+            inserted += len(new_postings)
+            skipped += len(postings) - len(new_postings)
+
+        console.log(
+            f'Postings saved successfully! {inserted} new, {skipped} skipped',
+            style='green'
+        )
 
-        console.log(f'About to save {len(postings)} postings')
-        for posting in postings:
-            posting_repository.create_posting(posting)
-        console.log('Postings saved successfully!', style='green')
+        return inserted, skipped
 
 
 class PostingServiceFactory:
@@ -25,58 +51,118 @@ class PostingServiceFactory:
     def build_for_zonaprop(
         cls,
         pages: int,
-        full_url: str
+        full_url: str,
+        concurrency: int = 1,
+        fast_parse: bool = True,
+        incremental: bool = False,
+        full_crawl_interval: int = 3600,
+        message_renderer: Optional[Callable[[ScrapedPosting], Dict]] = None,
     ) -> PostingService:
         scrapper_service = ScraperServiceFactory.build_for_zonaprop(
             pages=pages,
             full_url=full_url,
+            concurrency=concurrency,
+            fast_parse=fast_parse,
+            incremental=incremental,
+            full_crawl_interval=full_crawl_interval,
+        )
+        return PostingService(
+            scraper_service=scrapper_service,
+            message_renderer=message_renderer,
         )
-        return PostingService(scraper_service=scrapper_service)
 
     @classmethod
     def build_for_argenprop(
         cls,
         pages: int,
-        full_url: str
+        full_url: str,
+        concurrency: int = 1,
+        fast_parse: bool = True,
+        incremental: bool = False,
+        full_crawl_interval: int = 3600,
+        message_renderer: Optional[Callable[[ScrapedPosting], Dict]] = None,
     ) -> PostingService:
         scrapper_service = ScraperServiceFactory.build_for_argenprop(
             pages=pages,
             full_url=full_url,
+            concurrency=concurrency,
+            fast_parse=fast_parse,
+            incremental=incremental,
+            full_crawl_interval=full_crawl_interval,
+        )
+        return PostingService(
+            scraper_service=scrapper_service,
+            message_renderer=message_renderer,
         )
-        return PostingService(scraper_service=scrapper_service)
 
     @classmethod
     def build_for_mercadolibre(
         cls,
         pages: int,
-        full_url: str
+        full_url: str,
+        concurrency: int = 1,
+        fast_parse: bool = True,
+        incremental: bool = False,
+        full_crawl_interval: int = 3600,
+        message_renderer: Optional[Callable[[ScrapedPosting], Dict]] = None,
     ) -> PostingService:
         scrapper_service = ScraperServiceFactory.build_for_mercadolibre(
             pages=pages,
             full_url=full_url,
+            concurrency=concurrency,
+            fast_parse=fast_parse,
+            incremental=incremental,
+            full_crawl_interval=full_crawl_interval,
+        )
+        return PostingService(
+            scraper_service=scrapper_service,
+            message_renderer=message_renderer,
         )
-        return PostingService(scraper_service=scrapper_service)
 
     @classmethod
     def build_for_la_voz(
         cls,
         pages: int,
-        full_url: str
+        full_url: str,
+        concurrency: int = 1,
+        fast_parse: bool = True,
+        incremental: bool = False,
+        full_crawl_interval: int = 3600,
+        message_renderer: Optional[Callable[[ScrapedPosting], Dict]] = None,
     ) -> PostingService:
         scrapper_service = ScraperServiceFactory.build_for_la_voz(
             pages=pages,
             full_url=full_url,
+            concurrency=concurrency,
+            fast_parse=fast_parse,
+            incremental=incremental,
+            full_crawl_interval=full_crawl_interval,
+        )
+        return PostingService(
+            scraper_service=scrapper_service,
+            message_renderer=message_renderer,
         )
-        return PostingService(scraper_service=scrapper_service)
 
     @classmethod
     def build_for_properati(
         cls,
         pages: int,
-        full_url: str
+        full_url: str,
+        concurrency: int = 1,
+        fast_parse: bool = True,
+        incremental: bool = False,
+        full_crawl_interval: int = 3600,
+        message_renderer: Optional[Callable[[ScrapedPosting], Dict]] = None,
     ) -> PostingService:
         scrapper_service = ScraperServiceFactory.build_for_properati(
             pages=pages,
             full_url=full_url,
+            concurrency=concurrency,
+            fast_parse=fast_parse,
+            incremental=incremental,
+            full_crawl_interval=full_crawl_interval,
+        )
+        return PostingService(
+            scraper_service=scrapper_service,
+            message_renderer=message_renderer,
         )
-        return PostingService(scraper_service=scrapper_service)
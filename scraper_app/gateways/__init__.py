@@ -4,3 +4,7 @@ from .argenprop import ArgenpropGateway
 from .mercadolibre import MercadolibreGateway
 from .lavoz import LaVozGateway
 from .properati import ProperatiGateway
+from .cache import CachedResponse, ResponseCache, response_cache
+from .cassette import Cassette, RecordedResponse, cassette
+from .limiter import HostRateLimiter, RateLimiterPool, rate_limiter
+from .session import ScraperSessionPool, session_pool
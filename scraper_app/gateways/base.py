@@ -1,44 +1,117 @@
 from abc import ABC
+from typing import Dict
+from urllib.parse import urlparse
 
-import cloudscraper
-from requests.exceptions import InvalidSchema
+from requests.exceptions import InvalidSchema, RequestException
 from rich.console import Console
 
+from .cache import ResponseCache, response_cache
+from .cassette import Cassette, cassette
+from .limiter import parse_retry_after, rate_limiter, RateLimiterPool
+from .session import ScraperSessionPool, session_pool
+
 console = Console()
 
+# Cloudflare answers with these when the stored clearance is no longer valid
+CHALLENGE_STATUS_CODES = (403, 503)
+# Answers that mean we are going too fast for the host
+THROTTLE_STATUS_CODES = (403, 429, 503)
+
 
 class BaseGateway(ABC):
     paginated = True
+    session_pool: ScraperSessionPool = session_pool
+    response_cache: ResponseCache = response_cache
+    rate_limiter: RateLimiterPool = rate_limiter
+    cassette: Cassette = cassette
+    max_attempts = 3
 
-    def make_request(self, url: str) -> str:
+    def make_request(self, url: str, skip_unchanged: bool = False) -> str:
         '''
-        Makes the request to the full_url using cloudscraper
-        and returns the html in it.
+        Makes the request to the full_url using the pooled cloudscraper
+        session and returns the html in it.
+
+        Pages in the response cache are requested conditionally. With
+        `skip_unchanged` an empty string is returned when the page is
+        identical to the cached one and that one was already committed
+        (see `commit_page`), so it isn't parsed again.
+
+        Requests go through the host's shared rate limiter. Throttling
+        answers (403/429/503) slow the host down and are retried up to
+        `max_attempts` times, an empty string is returned if they keep
+        failing.
         '''
-        html = ''
-        scraper = cloudscraper.create_scraper()
+        cached = self.response_cache.get(url)
+        headers = cached.conditional_headers() if cached else {}
+        if self.cassette.recording:
+            # A 304 has no page to record, ask for the full one
+            headers = {}
+        limiter = self.rate_limiter.get(urlparse(url).netloc)
         console.log(
             'On my way to [bold cyan]GET[/bold cyan] [u]{}[/u]'.format(
                 self._name
             )
         )
 
-        try:
-            res = scraper.get(url)
-        except InvalidSchema as e:
-            console.log(
-                '[bold u]ERROR[/bold u]: {} raised InvalidSchema.\n {}'.format(
-                     self._name, e
+        res = None
+        for attempt in range(1, self.max_attempts + 1):
+            if not self.cassette.replaying:
+                limiter.acquire()
+            try:
+                with self.session_pool.session(self._name) as scraper:
+                    res = self._get(scraper, url, headers)
+            except InvalidSchema as e:
+                console.log(
+                    '[bold u]ERROR[/bold u]: {} raised InvalidSchema.\n {}'.format(
+                         self._name, e
+                    )
                 )
+                return ''
+            except RequestException as e:
+                console.log(
+                    '[bold u]ERROR[/bold u]: {} request failed.\n {}'.format(
+                        self._name, e
+                    )
+                )
+                limiter.on_throttle()
+                continue
+
+            if res.status_code not in THROTTLE_STATUS_CODES:
+                limiter.on_success()
+                break
+
+            limiter.on_throttle(
+                retry_after=parse_retry_after(res.headers.get('Retry-After'))
             )
+            console.log(
+                '{} throttled us with {} (attempt {} of {}), slowing down to'
+                ' {:.2f} requests/s'.format(
+                    self._name,
+                    res.status_code,
+                    attempt,
+                    self.max_attempts,
+                    limiter.rate,
+                ),
+                style='yellow'
+            )
+            if res.status_code in CHALLENGE_STATUS_CODES:
+                # The challenge probably expired, retry with a clean session
+                self.session_pool.rebuild(self._name, stale=scraper)
+
+        if res is None:
+            return ''
 
-        if res.ok:
-            html = res.text
+        if res.status_code == 304 and cached:
+            self.response_cache.revalidated(cached)
             console.log(
-                '{} responded OK!'.format(self._name),
+                '{} page not modified'.format(self._name),
                 style='green'
             )
-        else:
+            if skip_unchanged and cached.processed:
+                return ''
+            return cached.body
+
+        if not res.ok:
             console.log(
                 (
                     '[bold u]ERROR[/bold u]: {} responded'
@@ -48,5 +121,40 @@ class BaseGateway(ABC):
                 ),
                 style='red'
             )
+            return ''
+
+        html = res.text
+        console.log(
+            '{} responded OK!'.format(self._name),
+            style='green'
+        )
+        unchanged = self.response_cache.store(
+            url,
+            html,
+            etag=res.headers.get('ETag'),
+            last_modified=res.headers.get('Last-Modified'),
+            previous=cached,
+        )
+        if unchanged and skip_unchanged:
+            console.log('{} page unchanged, skipping it'.format(self._name))
+            return ''
+
+        return html
+
+    def commit_page(self, url: str):
+        '''The postings of the page at `url` are stored, see `make_request`.'''
+        self.response_cache.commit(url)
+
+    def _get(self, scraper, url: str, headers: Dict[str, str]):
+        '''GETs the url, or serves it from the cassette when replaying.'''
+        if self.cassette.replaying:
+            return self.cassette.replay(url)
+
+        res = scraper.get(url, headers=headers)
+        if self.cassette.recording:
+            self.cassette.record(url, res)
+        return res
 
-        return html
\ No newline at end of file
+    def close(self):
+        '''Closes the pooled session used by this gateway.'''
+        self.session_pool.close(self._name)
@@ -0,0 +1,227 @@
+import gzip
+import hashlib
+import json
+import os
+from threading import Lock
+from time import time
+from typing import Dict, Optional
+
+
+def hash_body(body: str) -> str:
+    return hashlib.sha1(body.encode('utf-8')).hexdigest()
+
+
+class CachedResponse:
+    '''
+    A listing page as it was last downloaded. `processed` is set once
+    its postings were stored, until then the page is parsed again even
+    if it didn't change.
+    '''
+
+    __slots__ = (
+        'url',
+        'body',
+        'body_hash',
+        'etag',
+        'last_modified',
+        'stored_at',
+        'processed',
+    )
+
+    def __init__(
+        self,
+        url: str,
+        body: str,
+        body_hash: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        stored_at: Optional[float] = None,
+        processed: bool = False,
+    ):
+        self.url = url
+        self.body = body
+        self.body_hash = body_hash
+        self.etag = etag
+        self.last_modified = last_modified
+        self.stored_at = stored_at or time()
+        self.processed = processed
+
+    def conditional_headers(self) -> Dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def as_dict(self) -> Dict:
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+
+class ResponseCache:
+    '''
+    On-disk cache of listing pages keyed by url, one gzipped JSON file
+    per url so it survives restarts. Entries older than `ttl` seconds
+    are dropped, and once the directory grows past `max_bytes` the
+    least recently used entries are evicted. Disabled until a
+    directory is configured.
+    '''
+
+    def __init__(self):
+        self._lock = Lock()
+        self.directory: Optional[str] = None
+        self.ttl = 24 * 60 * 60
+        self.max_bytes = 50 * 1024 * 1024
+        self.revalidated_count = 0
+        self.unchanged_count = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.directory is not None
+
+    def configure(
+        self,
+        directory: Optional[str],
+        ttl: int = 24 * 60 * 60,
+        max_bytes: int = 50 * 1024 * 1024,
+    ):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def get(self, url: str) -> Optional[CachedResponse]:
+        '''Returns the cached page for `url`, None if missing or expired.'''
+        if not self.enabled:
+            return None
+
+        path = self._path(url)
+        entry = self._read(path)
+        if entry is None:
+            return None
+
+        if entry.url != url or time() - entry.stored_at > self.ttl:
+            self._remove(path)
+            return None
+
+        # mtime tracks the last use, eviction goes by it
+        self._touch(path)
+        return entry
+
+    def revalidated(self, entry: CachedResponse):
+        '''The server answered 304, the cached page is still current.'''
+        entry.stored_at = time()
+        self.revalidated_count += 1
+        if entry.processed:
+            self.unchanged_count += 1
+        self._write(entry)
+
+    def store(
+        self,
+        url: str,
+        body: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        previous: Optional[CachedResponse] = None,
+    ) -> bool:
+        '''
+        Saves a freshly downloaded page. Returns True when its body is
+        byte-identical to the `previous` cached one and that one was
+        already processed.
+        '''
+        body_hash = hash_body(body)
+        unchanged = (
+            previous is not None
+            and previous.processed
+            and previous.body_hash == body_hash
+        )
+        entry = CachedResponse(
+            url=url,
+            body=body,
+            body_hash=body_hash,
+            etag=etag,
+            last_modified=last_modified,
+            processed=unchanged,
+        )
+        if unchanged:
+            self.unchanged_count += 1
+        if self.enabled:
+            self._write(entry)
+            self._evict()
+        return unchanged
+
+    def commit(self, url: str):
+        '''
+        Marks the cached page as processed, call it once its postings
+        are stored. From then on it's skipped while it doesn't change.
+        '''
+        if not self.enabled:
+            return
+
+        entry = self._read(self._path(url))
+        if entry is None or entry.url != url or entry.processed:
+            return
+        entry.processed = True
+        self._write(entry)
+
+    def clear(self):
+        if not self.enabled:
+            return
+        for name in os.listdir(self.directory):
+            self._remove(os.path.join(self.directory, name))
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'revalidated': self.revalidated_count,
+            'unchanged': self.unchanged_count,
+        }
+
+    def _path(self, url: str) -> str:
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, '{}.json.gz'.format(key))
+
+    def _read(self, path: str) -> Optional[CachedResponse]:
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as fh:
+                return CachedResponse(**json.load(fh))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def _write(self, entry: CachedResponse):
+        path = self._path(entry.url)
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with self._lock:
+            with gzip.open(tmp_path, 'wt', encoding='utf-8') as fh:
+                json.dump(entry.as_dict(), fh)
+            os.replace(tmp_path, path)
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for dir_entry in os.scandir(self.directory):
+                if dir_entry.name.endswith('.json.gz'):
+                    stat = dir_entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, dir_entry.path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+
+    def _touch(self, path: str):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _remove(self, path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,114 @@
+import gzip
+import hashlib
+import json
+import os
+from time import sleep
+from typing import Dict, Optional
+
+# Response headers the gateways look at, the rest aren't recorded
+RECORDED_HEADERS = ('ETag', 'Last-Modified', 'Retry-After')
+
+
+class RecordedResponse:
+    '''The parts of a `requests.Response` the gateways use.'''
+
+    def __init__(
+        self,
+        url: str,
+        status_code: int,
+        text: str,
+        headers: Optional[Dict[str, str]] = None,
+    ):
+        self.url = url
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    def as_dict(self) -> Dict:
+        return {
+            'url': self.url,
+            'status_code': self.status_code,
+            'text': self.text,
+            'headers': self.headers,
+        }
+
+
+class Cassette:
+    '''
+    Records the gateway responses to a directory of gzipped JSON files,
+    one per url, and replays them later without touching the network.
+
+    `mode` is None (live requests), `record` or `replay`. When
+    replaying every response waits `latency` seconds, to simulate the
+    network, and urls that weren't recorded answer a 404.
+    '''
+
+    def __init__(self):
+        self.mode: Optional[str] = None
+        self.directory = 'cassettes'
+        self.latency = 0.0
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == 'record'
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == 'replay'
+
+    def configure(
+        self,
+        mode: Optional[str],
+        directory: str = 'cassettes',
+        latency: float = 0.0,
+    ):
+        if mode not in (None, 'record', 'replay'):
+            raise ValueError('Unknown cassette mode {}'.format(mode))
+        self.mode = mode
+        self.directory = directory
+        self.latency = latency
+        if mode == 'record':
+            os.makedirs(directory, exist_ok=True)
+
+    def record(self, url: str, response) -> None:
+        '''
+        Saves the response for `url`. A 304 isn't recorded, it has no
+        body and would replace the recorded page with an empty one.
+        '''
+        if response.status_code == 304:
+            return
+        recorded = RecordedResponse(
+            url=url,
+            status_code=response.status_code,
+            text=response.text,
+            headers={
+                header: response.headers[header]
+                for header in RECORDED_HEADERS
+                if header in response.headers
+            },
+        )
+        path = self._path(recorded.url)
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as fh:
+            json.dump(recorded.as_dict(), fh)
+        os.replace(tmp_path, path)
+
+    def replay(self, url: str) -> RecordedResponse:
+        if self.latency:
+            sleep(self.latency)
+        try:
+            with gzip.open(self._path(url), 'rt', encoding='utf-8') as fh:
+                return RecordedResponse(**json.load(fh))
+        except OSError:
+            return RecordedResponse(url=url, status_code=404, text='')
+
+    def _path(self, url: str) -> str:
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, '{}.json.gz'.format(key))
+
+
+cassette = Cassette()
@@ -0,0 +1,126 @@
+import email.utils
+from threading import Lock
+from time import monotonic, sleep, time
+from typing import Dict, Optional
+
+
+def parse_retry_after(value: Optional[str], limit: float = 300) -> Optional[float]:
+    '''
+    Seconds to wait from a `Retry-After` header, given either in
+    seconds or as an HTTP date. Capped at `limit`.
+    '''
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            retry_at = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if retry_at is None:
+            return None
+        seconds = retry_at.timestamp() - time()
+
+    return min(max(seconds, 0), limit)
+
+
+class HostRateLimiter:
+    '''
+    Token bucket for one host whose rate adapts AIMD style: every
+    successful response adds `increase` requests per second up to
+    `max_rate`, every throttling response halves it down to `min_rate`
+    and, when the server sends a `Retry-After`, holds every request to
+    the host until it has passed.
+    '''
+
+    def __init__(
+        self,
+        rate: float = 1.0,
+        burst: int = 2,
+        min_rate: float = 0.05,
+        max_rate: float = 4.0,
+        increase: float = 0.1,
+        decrease: float = 0.5,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self._tokens = float(burst)
+        self._updated_at = monotonic()
+        self._blocked_until = 0.0
+        self._lock = Lock()
+        self.throttled = 0
+
+    def acquire(self):
+        '''Blocks until a request to the host is allowed.'''
+        while True:
+            with self._lock:
+                now = monotonic()
+                self._refill(now)
+                if now >= self._blocked_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = max(
+                    self._blocked_until - now,
+                    (1 - self._tokens) / self.rate,
+                )
+            sleep(wait)
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.rate + self.increase, self.max_rate)
+
+    def on_throttle(self, retry_after: Optional[float] = None):
+        with self._lock:
+            self.throttled += 1
+            self.rate = max(self.rate * self.decrease, self.min_rate)
+            # Without a Retry-After wait at least one slot at the new rate
+            wait = retry_after if retry_after is not None else 1 / self.rate
+            now = monotonic()
+            self._blocked_until = max(self._blocked_until, now + wait)
+            self._tokens = min(self._tokens, 0)
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated_at
+        self._tokens = min(self._tokens + elapsed * self.rate, self.burst)
+        self._updated_at = now
+
+
+class RateLimiterPool:
+    '''
+    One `HostRateLimiter` per host, shared by every search and worker
+    thread that hits it.
+    '''
+
+    def __init__(self):
+        self._limiters: Dict[str, HostRateLimiter] = {}
+        self._lock = Lock()
+        self._settings = {}
+
+    def configure(self, **settings):
+        '''Sets the `HostRateLimiter` arguments for the hosts seen from now on.'''
+        with self._lock:
+            self._settings = settings
+            self._limiters = {}
+
+    def get(self, host: str) -> HostRateLimiter:
+        with self._lock:
+            limiter = self._limiters.get(host)
+            if limiter is None:
+                limiter = HostRateLimiter(**self._settings)
+                self._limiters[host] = limiter
+            return limiter
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                host: {'rate': limiter.rate, 'throttled': limiter.throttled}
+                for host, limiter in self._limiters.items()
+            }
+
+
+rate_limiter = RateLimiterPool()
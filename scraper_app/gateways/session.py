@@ -0,0 +1,117 @@
+from contextlib import contextmanager
+from threading import Lock
+from time import monotonic
+from typing import Dict, Iterator, Optional
+
+import cloudscraper
+
+
+class PooledSession:
+    '''A pooled session and how many requests are using it right now.'''
+
+    __slots__ = ('scraper', 'created_at', 'in_use', 'retired')
+
+    def __init__(self, scraper: cloudscraper.CloudScraper):
+        self.scraper = scraper
+        self.created_at = monotonic()
+        self.in_use = 0
+        self.retired = False
+
+
+class ScraperSessionPool:
+    '''
+    Keeps one cloudscraper session alive per key (usually the gateway
+    name) so the TCP/TLS connection, cookies and solved Cloudflare
+    challenge tokens are reused across pages and loop iterations.
+
+    The page threads of a site share its session. A session that gets
+    replaced (expired, or rebuilt after a challenge) is only closed
+    once no request is using it anymore.
+    '''
+
+    def __init__(self, max_age: Optional[float] = 30 * 60):
+        self._max_age = max_age
+        self._sessions: Dict[str, PooledSession] = {}
+        self._lock = Lock()
+        self.reused = 0
+        self.rebuilt = 0
+
+    @contextmanager
+    def session(self, key: str) -> Iterator[cloudscraper.CloudScraper]:
+        '''
+        Lends the session stored for `key` for one request, creating a
+        new one when there is none or when it is older than `max_age`.
+        '''
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry and self._expired(entry):
+                self._retire(key)
+                self.rebuilt += 1
+                entry = None
+            if entry:
+                self.reused += 1
+            else:
+                entry = self._build(key)
+            entry.in_use += 1
+
+        try:
+            yield entry.scraper
+        finally:
+            with self._lock:
+                entry.in_use -= 1
+                if entry.retired and not entry.in_use:
+                    entry.scraper.close()
+
+    def rebuild(
+        self,
+        key: str,
+        stale: Optional[cloudscraper.CloudScraper] = None,
+    ):
+        '''
+        Replaces the session stored for `key` (e.g. because its
+        challenge expired), the next request gets a fresh one. With
+        `stale` it's only replaced if it's still that session, so
+        threads that hit the same challenge rebuild it once.
+        '''
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry is None or (stale is not None and entry.scraper is not stale):
+                return
+            self._retire(key)
+            self.rebuilt += 1
+
+    def close(self, key: Optional[str] = None):
+        '''Closes the session for `key`, or every session if no key is given.'''
+        with self._lock:
+            keys = [key] if key else list(self._sessions)
+            for _key in keys:
+                self._retire(_key)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'open': len(self._sessions),
+            'reused': self.reused,
+            'rebuilt': self.rebuilt,
+        }
+
+    def _expired(self, entry: PooledSession) -> bool:
+        return (
+            self._max_age is not None
+            and monotonic() - entry.created_at > self._max_age
+        )
+
+    def _retire(self, key: str):
+        entry = self._sessions.pop(key, None)
+        if entry is None:
+            return
+        entry.retired = True
+        if not entry.in_use:
+            entry.scraper.close()
+
+    def _build(self, key: str) -> PooledSession:
+        entry = PooledSession(cloudscraper.create_scraper())
+        self._sessions[key] = entry
+        return entry
+
+
+session_pool = ScraperSessionPool()
@@ -3,4 +3,5 @@ from .zonaprop import ZonapropParser
 from .argenprop import ArgenpropParser
 from .mercadolibre import MercadolibreParser
 from .lavoz import LaVozParser
-from .properati import ProperatiParser
\ No newline at end of file
+from .properati import ProperatiParser
+from .pool import ParsePool, parse_pool
@@ -1,20 +1,60 @@
 from abc import ABC
 from hashlib import sha1
-from typing import Set
+from typing import Dict, Iterable, Iterator, List, Set, Type
 
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 
-from posting_app.database import Posting
+from .spec import ParserSpec, sanitize_text
+from posting_app.records import ScrapedPosting
+
+try:
+    import lxml  # noqa: F401
+    FAST_PARSER_BACKEND = 'lxml'
+except ImportError:
+    FAST_PARSER_BACKEND = 'html.parser'
+
+
+def has_class(css_class: str):
+    '''
+    SoupStrainer sees the raw class attribute while parsing, so
+    'andes-card poly-card' doesn't match 'andes-card' by itself.
+    '''
+    def match(value) -> bool:
+        if not value:
+            return False
+        classes = value.split() if isinstance(value, str) else value
+        return css_class in classes
+
+    return match
 
 
 class BaseParser(ABC):
+    spec: ParserSpec = None
+
+    def __init__(self, fast_parse: bool = True):
+        self.fast_parse = fast_parse
+
+    def get_strainer(self) -> SoupStrainer:
+        tag, css_class = self.spec.strainer_tag, self.spec.strainer_class
+        if css_class is None:
+            # class_=None would only keep tags without a class
+            return SoupStrainer(tag)
+        return SoupStrainer(tag, class_=has_class(css_class))
 
     def get_soup_object(self, html: str):
         '''
         Taking HTML code as an entry, returns
-        a BeautifulSoup object of the HTML code
+        a BeautifulSoup object of the HTML code.
+
+        In fast parse mode it uses lxml (when installed) and only
+        builds the card subtrees.
         '''
-        self.soup = BeautifulSoup(html, 'html.parser')
+        if self.fast_parse:
+            self.soup = BeautifulSoup(
+                html, FAST_PARSER_BACKEND, parse_only=self.get_strainer()
+            )
+        else:
+            self.soup = BeautifulSoup(html, 'html.parser')
     
     def get_id(self, text: str) -> str:
         '''Get a SHA1 hash to identify each object.
@@ -44,7 +84,46 @@ class BaseParser(ABC):
         Sometimes the message comes out weirdly from the html
         this fixes it for you.
         '''
-        return ' '.join(text.split())
+        return sanitize_text(text)
+
+    def iter_records(self) -> Iterator[Dict]:
+        '''
+        Yields the data of each card as a plain dict as soon as it's
+        parsed. Dicts are cheap to pickle and send across processes.
+        '''
+        if self.spec.container_class is None:
+            cards = self.soup.find_all(self.spec.container_tag)
+        else:
+            cards = self.soup.find_all(
+                self.spec.container_tag, class_=self.spec.container_class
+            )
+
+        for card in cards:
+            values = self.spec.extract(card)
+            if values is None:
+                continue
+
+            values['sha'] = self.get_id(values['url'])
+            yield values
+
+    def extract_records(self) -> List[Dict]:
+        return list(self.iter_records())
+
+    def build_postings(self, records: Iterable[Dict]) -> List[ScrapedPosting]:
+        '''Builds the postings keeping the order of the cards in the page'''
+        return [ScrapedPosting(**record) for record in records]
+
+    def extract_data(self) -> Set[ScrapedPosting]:
+        '''Extracting data and returning the set of postings'''
+        return set(self.build_postings(self.iter_records()))
+
 
-    def extract_data(self) -> Set[Posting]:
-        pass
\ No newline at end of file
+def parse_records(
+    parser_class: Type[BaseParser],
+    fast_parse: bool,
+    html: str,
+) -> List[Dict]:
+    '''Parses a page with a fresh parser, used by the parse pool workers.'''
+    parser = parser_class(fast_parse=fast_parse)
+    parser.get_soup_object(html=html)
+    return parser.extract_records()
@@ -0,0 +1,53 @@
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from threading import Lock
+from typing import Optional
+
+from .base import BaseParser, parse_records
+
+
+class ParsePool:
+    '''
+    Optional process pool that parses pages off the main process.
+    Workers get the raw HTML and return plain records; dedupe and
+    persistence stay in the main process. Searches with fewer than
+    `min_pages` pages are parsed in-process, where the pickling
+    overhead isn't worth it.
+    '''
+
+    def __init__(self):
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = Lock()
+        self.workers = 0
+        self.min_pages = 4
+
+    def configure(self, workers: int, min_pages: int = 4):
+        self.close()
+        self.workers = workers
+        self.min_pages = min_pages
+
+    def should_use(self, pages: int) -> bool:
+        return self.workers > 1 and pages >= self.min_pages
+
+    def submit(self, parser: BaseParser, html: str) -> Future:
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a process that runs scraping threads isn't safe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+            executor = self._executor
+
+        return executor.submit(
+            parse_records, type(parser), parser.fast_parse, html
+        )
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+            self._executor = None
+
+
+parse_pool = ParsePool()
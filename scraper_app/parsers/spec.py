@@ -0,0 +1,147 @@
+import re
+from typing import Callable, Dict, Optional
+
+import soupsieve
+
+
+def sanitize_text(text: str) -> str:
+    '''
+    Sometimes the message comes out weirdly from the html
+    this fixes it for you.
+    '''
+    return ' '.join(text.split())
+
+
+def prefix_with(base_url: str) -> Callable[[str], str]:
+    return lambda href: '{}{}'.format(base_url, href)
+
+
+def listing_id_from(pattern: str) -> Callable[[str], Optional[int]]:
+    '''
+    Builds an extractor of the site's numeric listing id from a posting
+    url, `pattern` must capture the digits in its first group.
+    '''
+    regex = re.compile(pattern)
+
+    def extract(url: str) -> Optional[int]:
+        match = regex.search(url)
+        return int(match.group(1)) if match else None
+
+    return extract
+
+
+class FieldSpec:
+    '''
+    How to get one posting field out of a card.
+
+    The CSS `selector` is compiled once, when the spec is declared.
+    Without a selector the field is read from the card itself, or from
+    its closest `parent` tag when given. The value is the `attr`
+    attribute of the matched tag or its sanitized text, and `process`
+    runs on it afterwards. A `required` field is missing when the tag
+    isn't there or the value is empty (e.g. an `href=""`). With `many`
+    every match is returned as a list of texts.
+    '''
+
+    def __init__(
+        self,
+        selector: Optional[str] = None,
+        attr: Optional[str] = None,
+        required: bool = False,
+        many: bool = False,
+        parent: Optional[str] = None,
+        separator: str = '',
+        default: str = '',
+        process: Optional[Callable] = None,
+    ):
+        self.selector = soupsieve.compile(selector) if selector else None
+        self.attr = attr
+        self.required = required
+        self.many = many
+        self.parent = parent
+        self.separator = separator
+        self.default = default
+        self.process = process
+
+    def extract(self, card):
+        '''Returns the field value, or None when a required field is missing.'''
+        if self.many:
+            value = [self._read(node) for node in self.selector.select(card)]
+            return self.process(value) if self.process else value
+
+        node = card
+        if self.parent:
+            node = node.find_parent(self.parent)
+        if node is not None and self.selector:
+            node = self.selector.select_one(node)
+
+        if node is None:
+            return None if self.required else self.default
+
+        value = self._read(node)
+        if not value and self.required:
+            return None
+        return self.process(value) if self.process else value
+
+    def _read(self, node) -> str:
+        if self.attr:
+            return node.get(self.attr, '')
+        return sanitize_text(node.get_text(self.separator))
+
+
+class ParserSpec:
+    '''
+    Declares how a site's listing page is parsed: which tags are the
+    cards, which fields come out of each card and an optional
+    `post_process` that gets the extracted fields and returns the
+    final ones. Posting fields are `url`, `title`, `price`, `location`
+    and `description`.
+
+    `source` names the site and `listing_id` pulls the site's stable
+    numeric id out of the url, which dedupes postings whose url slug
+    changes. Sites without one fall back to the url hash alone.
+    '''
+
+    def __init__(
+        self,
+        container_tag: str,
+        container_class: Optional[str],
+        fields: Dict[str, FieldSpec],
+        strainer_tag: Optional[str] = None,
+        strainer_class: Optional[str] = None,
+        post_process: Optional[Callable[[Dict], Dict]] = None,
+        source: Optional[str] = None,
+        listing_id: Optional[Callable[[str], Optional[int]]] = None,
+    ):
+        self.source = source
+        self.listing_id = listing_id
+        self.container_tag = container_tag
+        self.container_class = container_class
+        self.fields = fields
+        # Subtrees kept in fast parse mode, defaults to the cards
+        self.strainer_tag = strainer_tag or container_tag
+        self.strainer_class = (
+            strainer_class if strainer_tag else container_class
+        )
+        self.post_process = post_process
+
+    def extract(self, card) -> Optional[Dict]:
+        '''Extracts the fields of a card, None if a required one is missing.'''
+        values = {}
+        for name, field in self.fields.items():
+            value = field.extract(card)
+            if value is None:
+                return None
+            values[name] = value
+
+        if self.post_process:
+            values = self.post_process(values)
+        if not values.get('url'):
+            # Cards without a link would all hash to the same sha
+            return None
+
+        values['source'] = self.source
+        values['listing_id'] = (
+            self.listing_id(values['url']) if self.listing_id else None
+        )
+        return values
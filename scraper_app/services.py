@@ -1,4 +1,13 @@
-from typing import Optional, List
+import datetime
+from concurrent.futures import (
+    as_completed,
+    FIRST_COMPLETED,
+    ThreadPoolExecutor,
+    wait,
+)
+from threading import BoundedSemaphore, Lock
+from typing import Dict, Iterable, Iterator, Optional, List, Set, Tuple
+from urllib.parse import urlparse
 
 from rich.console import Console
 
@@ -17,11 +26,33 @@ from .parsers import (
     MercadolibreParser,
     ProperatiParser,
     ZonapropParser,
+    parse_pool,
+)
+from posting_app.database import (
+    known_listing_ids,
+    known_shas,
+    PostingRepository,
+    SearchCrawlStateRepository,
 )
-from posting_app.database import Posting
+from posting_app.records import ScrapedPosting
 
 console = Console()
 
+_host_semaphores: Dict[str, BoundedSemaphore] = {}
+_host_semaphores_lock = Lock()
+
+
+def get_host_semaphore(url: str, limit: int) -> BoundedSemaphore:
+    '''
+    Returns the semaphore that caps how many requests can be in
+    flight at the same time against the host of `url`.
+    '''
+    host = urlparse(url).netloc
+    with _host_semaphores_lock:
+        if host not in _host_semaphores:
+            _host_semaphores[host] = BoundedSemaphore(limit)
+        return _host_semaphores[host]
+
 
 class ScraperService:
     def __init__(
@@ -30,29 +61,213 @@ class ScraperService:
         url: str,
         gateway: BaseGateway,
         parser: BaseParser,
+        concurrency: int = 1,
+        incremental: bool = False,
+        full_crawl_interval: int = 3600,
     ):
         self._pages = pages
         self._url = url
         self._gateway = gateway
         self._parser = parser
+        self._concurrency = concurrency
+        self._incremental = incremental
+        self._full_crawl_interval = full_crawl_interval
+        self._posting_repository = PostingRepository()
+        self._crawl_state_repository = SearchCrawlStateRepository()
 
-    def get_postings_from_scraper(self) -> List[Posting]:
+    def get_postings_from_scraper(self) -> Set[ScrapedPosting]:
         postings = set()
+        for new_postings in self.iter_postings():
+            postings.update(new_postings)
+
+        return postings
+
+    def iter_postings(self) -> Iterator[Set[ScrapedPosting]]:
+        '''
+        Yields the new postings of each page as soon as that page is
+        parsed and deduped, while the following pages are fetched.
+
+        A page is committed to the response cache when the next one is
+        asked for, i.e. once the consumer stored its postings. If the
+        consumer fails the page is parsed again on the next cycle.
+        '''
         pages = self._pages if self._gateway.paginated else 1
+        if self._incremental and pages > 1:
+            yield from self._iter_postings_incrementally(pages)
+        else:
+            yield from self._iter_pages(1, pages)
 
-        for page in range(1, pages + 1):
-            console.log(f'Page {page} of {pages}')
-            html = self._gateway.make_request(
-                url=self._url.format(page)
+    def _iter_pages(self, first: int, pages: int) -> Iterator[Set[ScrapedPosting]]:
+        if self._concurrency > 1 and pages > first:
+            fetched_pages = self._fetch_pages_concurrently(first, pages)
+        else:
+            fetched_pages = self._fetch_pages(first, pages)
+
+        if parse_pool.should_use(pages - first + 1):
+            parsed_pages = self._parse_in_pool(fetched_pages)
+        else:
+            parsed_pages = (
+                (url, self._parse(html)) for url, html in fetched_pages
             )
 
-            self._parser.get_soup_object(html=html)
-            new_postings = self._parser.extract_data()
+        for url, candidates in parsed_pages:
+            new_postings = self._filter_unseen(candidates)
             console.log(f'Got {len(new_postings)} new postings')
 
-            postings = postings.union(new_postings)
+            yield new_postings
+            self._gateway.commit_page(url)
 
-        return postings
+    def _iter_postings_incrementally(
+        self,
+        pages: int,
+    ) -> Iterator[Set[ScrapedPosting]]:
+        '''
+        For searches sorted newest first: stops paginating on the first
+        page with nothing new or holding the newest posting seen on the
+        previous crawl. Every `full_crawl_interval` seconds all the
+        pages are crawled anyway, in case the results got re-sorted.
+        '''
+        crawl_state = self._crawl_state_repository.get_crawl_state(self._url)
+        full_crawl = crawl_state.full_crawl_due(self._full_crawl_interval)
+        high_water_sha = crawl_state.high_water_sha
+
+        page = 1
+        candidates, new_postings = yield from self._iter_single_page(page, pages)
+        if candidates:
+            crawl_state.high_water_sha = candidates[0].sha
+
+        if full_crawl:
+            yield from self._iter_pages(page + 1, pages)
+            crawl_state.last_full_crawl = datetime.datetime.utcnow()
+        else:
+            while page < pages and not self._reached_known_postings(
+                candidates, new_postings, high_water_sha
+            ):
+                page += 1
+                candidates, new_postings = yield from self._iter_single_page(
+                    page, pages
+                )
+            if page < pages:
+                console.log(
+                    f'Stopped at page {page} of {pages}, the rest is already known'
+                )
+
+        self._crawl_state_repository.save_crawl_state(crawl_state)
+
+    def _iter_single_page(self, page: int, pages: int):
+        console.log(f'Page {page} of {pages}')
+        url = self._url.format(page)
+        candidates = self._parse(
+            self._gateway.make_request(url=url, skip_unchanged=True)
+        )
+        new_postings = self._filter_unseen(candidates)
+        console.log(f'Got {len(new_postings)} new postings')
+
+        yield new_postings
+        self._gateway.commit_page(url)
+        return candidates, new_postings
+
+    def _reached_known_postings(
+        self,
+        candidates: List[ScrapedPosting],
+        new_postings: Set[ScrapedPosting],
+        high_water_sha: Optional[str],
+    ) -> bool:
+        if not candidates or not new_postings:
+            return True
+        return any(posting.sha == high_water_sha for posting in candidates)
+
+    def _filter_unseen(
+        self,
+        candidates: Iterable[ScrapedPosting],
+    ) -> Set[ScrapedPosting]:
+        '''
+        Drops the postings already stored, matching them by url sha or
+        by the site's own listing id. The in-memory indexes answer for
+        most of them, the rest are checked with one query per key.
+        '''
+        unknown = {
+            posting for posting in candidates
+            if posting.sha not in known_shas
+            and posting.listing_key not in known_listing_ids
+        }
+        if not unknown:
+            return set()
+
+        existing_shas = self._posting_repository.get_existing_shas(
+            posting.sha for posting in unknown
+        )
+        existing_keys = self._posting_repository.get_existing_listing_keys(
+            posting.listing_key for posting in unknown if posting.listing_key
+        )
+        known_shas.update(existing_shas)
+        known_listing_ids.update(existing_keys)
+        return {
+            posting for posting in unknown
+            if posting.sha not in existing_shas
+            and posting.listing_key not in existing_keys
+        }
+
+    def _parse(self, html: str) -> List[ScrapedPosting]:
+        if not html:
+            # Failed request or a page unchanged since the last cycle
+            return []
+        self._parser.get_soup_object(html=html)
+        return self._parser.build_postings(self._parser.iter_records())
+
+    def _parse_in_pool(
+        self,
+        fetched_pages: Iterator[Tuple[str, str]],
+    ) -> Iterator[Tuple[str, List[ScrapedPosting]]]:
+        '''
+        Hands every page to the parse pool as soon as it's fetched and
+        yields the postings of each one as its worker finishes.
+        '''
+        pending = {}
+        for url, html in fetched_pages:
+            if html:
+                pending[parse_pool.submit(self._parser, html)] = url
+            # Hand over what's parsed so far before fetching on
+            for future in [future for future in pending if future.done()]:
+                yield pending.pop(future), self._parser.build_postings(
+                    future.result()
+                )
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), self._parser.build_postings(
+                    future.result()
+                )
+
+    def _fetch_page(self, page: int) -> Tuple[str, str]:
+        url = self._url.format(page)
+        with get_host_semaphore(url, self._concurrency):
+            return url, self._gateway.make_request(url=url, skip_unchanged=True)
+
+    def _fetch_pages(self, first: int, pages: int) -> Iterator[Tuple[str, str]]:
+        for page in range(first, pages + 1):
+            console.log(f'Page {page} of {pages}')
+            url = self._url.format(page)
+            yield url, self._gateway.make_request(url=url, skip_unchanged=True)
+
+    def _fetch_pages_concurrently(
+        self,
+        first: int,
+        pages: int,
+    ) -> Iterator[Tuple[str, str]]:
+        '''
+        Puts every page in flight at once (capped per host) and
+        yields each one as soon as it arrives.
+        '''
+        with ThreadPoolExecutor(max_workers=pages - first + 1) as executor:
+            futures = {
+                executor.submit(self._fetch_page, page): page
+                for page in range(first, pages + 1)
+            }
+            for future in as_completed(futures):
+                console.log(f'Page {futures[future]} of {pages} arrived')
+                yield future.result()
 
 
 class ScraperServiceFactory:
@@ -60,63 +275,98 @@ class ScraperServiceFactory:
     def build_for_zonaprop(
         cls,
         pages: int,
-        full_url: str
+        full_url: str,
+        concurrency: int = 1,
+        fast_parse: bool = True,
+        incremental: bool = False,
+        full_crawl_interval: int = 3600,
     ) -> ScraperService:
         return ScraperService(
             pages=pages,
             url=full_url,
             gateway=ZonapropGateway(),
-            parser=ZonapropParser(),
+            parser=ZonapropParser(fast_parse=fast_parse),
+            concurrency=concurrency,
+            incremental=incremental,
+            full_crawl_interval=full_crawl_interval,
         )
 
     @classmethod
     def build_for_argenprop(
         cls,
         pages: int,
-        full_url: str
+        full_url: str,
+        concurrency: int = 1,
+        fast_parse: bool = True,
+        incremental: bool = False,
+        full_crawl_interval: int = 3600,
     ) -> ScraperService:
         return ScraperService(
             pages=pages,
             url=full_url,
             gateway=ArgenpropGateway(),
-            parser=ArgenpropParser(),
+            parser=ArgenpropParser(fast_parse=fast_parse),
+            concurrency=concurrency,
+            incremental=incremental,
+            full_crawl_interval=full_crawl_interval,
         )
 
     @classmethod
     def build_for_mercadolibre(
         cls,
         pages: int,
-        full_url: str
+        full_url: str,
+        concurrency: int = 1,
+        fast_parse: bool = True,
+        incremental: bool = False,
+        full_crawl_interval: int = 3600,
     ) -> ScraperService:
         return ScraperService(
             pages=pages,
             url=full_url,
             gateway=MercadolibreGateway(),
-            parser=MercadolibreParser(),
+            parser=MercadolibreParser(fast_parse=fast_parse),
+            concurrency=concurrency,
+            incremental=incremental,
+            full_crawl_interval=full_crawl_interval,
         )
 
     @classmethod
     def build_for_la_voz(
         cls,
         pages: int,
-        full_url: str
+        full_url: str,
+        concurrency: int = 1,
+        fast_parse: bool = True,
+        incremental: bool = False,
+        full_crawl_interval: int = 3600,
     ) -> ScraperService:
         return ScraperService(
             pages=pages,
             url=full_url,
             gateway=LaVozGateway(),
-            parser=LaVozParser(),
+            parser=LaVozParser(fast_parse=fast_parse),
+            concurrency=concurrency,
+            incremental=incremental,
+            full_crawl_interval=full_crawl_interval,
         )
 
     @classmethod
     def build_for_properati(
         cls,
         pages: int,
-        full_url: str
+        full_url: str,
+        concurrency: int = 1,
+        fast_parse: bool = True,
+        incremental: bool = False,
+        full_crawl_interval: int = 3600,
     ) -> ScraperService:
         return ScraperService(
             pages=pages,
             url=full_url,
             gateway=ProperatiGateway(),
-            parser=ProperatiParser(),
+            parser=ProperatiParser(fast_parse=fast_parse),
+            concurrency=concurrency,
+            incremental=incremental,
+            full_crawl_interval=full_crawl_interval,
         )
@@ -0,0 +1,65 @@
+"""Fill `source` and `listing_id` for postings stored before those columns existed.
+
+This script will:
+- Work out the site of each posting without a listing id from its url
+- Extract the site's numeric listing id with that site's parser spec
+- Leave the listing id empty when another posting already has it (an older duplicate)
+"""
+import yaml
+from sqlmodel import Session, select
+from posting_app.database import (
+    configure_engine,
+    create_db_and_tables,
+    DatabaseConfig,
+    Posting,
+)
+from scraper_app.parsers import (
+    ArgenpropParser,
+    LaVozParser,
+    MercadolibreParser,
+    ProperatiParser,
+    ZonapropParser,
+)
+
+HOST_SPECS = {
+    'zonaprop.com.ar': ZonapropParser.spec,
+    'argenprop.com': ArgenpropParser.spec,
+    'mercadolibre.com.ar': MercadolibreParser.spec,
+    'lavoz.com.ar': LaVozParser.spec,
+    'properati.com.ar': ProperatiParser.spec,
+}
+
+cfg = yaml.safe_load(open('config.yaml'))
+engine = configure_engine(DatabaseConfig(**cfg))
+create_db_and_tables()
+
+with Session(engine) as s:
+    taken = set(s.exec(
+        select(Posting.source, Posting.listing_id).where(Posting.listing_id != None)
+    ))
+    stmt = select(Posting).where(Posting.listing_id == None).order_by(Posting.id)
+    pending = s.exec(stmt).all()
+
+    filled = 0
+    duplicates = 0
+
+    for p in pending:
+        spec = next(
+            (spec for host, spec in HOST_SPECS.items() if host in p.url), None
+        )
+        if not spec:
+            continue
+
+        p.source = spec.source
+        listing_id = spec.listing_id(p.url) if spec.listing_id else None
+        if listing_id is not None and (spec.source, listing_id) in taken:
+            duplicates += 1
+        elif listing_id is not None:
+            p.listing_id = listing_id
+            taken.add((spec.source, listing_id))
+            filled += 1
+        s.add(p)
+
+    s.commit()
+
+print(f'Filled listing ids: {filled}. Older duplicates left without one: {duplicates}.')
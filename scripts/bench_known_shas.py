@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Compare the known-sha index against the per-card database lookup.
+
+Creates a throwaway database with `--postings` rows and checks
+`--cards` scraped shas (most of them already known) against it.
+Usage: PYTHONPATH=. ./venv/bin/python scripts/bench_known_shas.py
+"""
+import argparse
+import os
+import random
+import tempfile
+from hashlib import sha1
+from time import perf_counter
+
+from sqlmodel import Session
+
+from posting_app.database import (
+    configure_engine,
+    create_db_and_tables,
+    DatabaseConfig,
+    known_shas,
+    load_known_shas,
+    Posting,
+    PostingRepository,
+)
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--postings', type=int, default=50000)
+parser.add_argument('--cards', type=int, default=2000)
+parser.add_argument('--known-ratio', type=float, default=0.95)
+args = parser.parse_args()
+
+workdir = tempfile.mkdtemp()
+engine = configure_engine(
+    DatabaseConfig(database_path=os.path.join(workdir, 'bench.db'))
+)
+
+
+def make_sha(number: int) -> str:
+    return sha1(str(number).encode('utf-8')).hexdigest()
+
+
+create_db_and_tables()
+with Session(engine) as session:
+    session.add_all(
+        Posting(sha=make_sha(i), url='https://example.com/{}'.format(i))
+        for i in range(args.postings)
+    )
+    session.commit()
+
+cards = [
+    make_sha(random.randrange(args.postings))
+    if random.random() < args.known_ratio
+    else make_sha(args.postings + i)
+    for i in range(args.cards)
+]
+repo = PostingRepository()
+
+
+def timed(label, func, per_card=True):
+    started_at = perf_counter()
+    result = func()
+    elapsed = perf_counter() - started_at
+    per_card_us = '{:>8.2f} us/card'.format(elapsed / len(cards) * 1e6)
+    print('{:<28} {:>10.2f} ms  {:>16}  result={}'.format(
+        label, elapsed * 1000, per_card_us if per_card else '', result
+    ))
+
+
+timed('per-card query', lambda: sum(
+    1 for sha in cards if not repo.get_posting_by_sha(sha)
+))
+timed('bulk IN query', lambda: len(set(cards) - repo.get_existing_shas(cards)))
+
+timed('load index from db', lambda: len(load_known_shas()), per_card=False)
+timed('index (set)', lambda: sum(1 for sha in cards if sha not in known_shas))
+
+snapshot_path = os.path.join(workdir, 'known_shas.bin')
+known_shas.save_snapshot(snapshot_path)
+known_shas.clear()
+timed(
+    'load index from snapshot',
+    lambda: len(load_known_shas(snapshot_path)),
+    per_card=False,
+)
+timed('index (mmap snapshot)', lambda: sum(1 for sha in cards if sha not in known_shas))
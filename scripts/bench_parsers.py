@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""Benchmark the parsers on saved and synthetically scaled listing pages.
+
+Parses the saved listing pages in scripts/fixtures, and copies of them
+scaled up to thousands of cards, with the full html.parser tree and
+with the fast mode (lxml + card-only SoupStrainer). Reports cards per
+second, time per page and peak memory for each backend. With --output
+the results are written as JSON, and --compare prints how they changed
+against a JSON written by another commit.
+Usage: PYTHONPATH=. ./venv/bin/python scripts/bench_parsers.py --output bench_parsers.json
+"""
+import argparse
+import copy
+import json
+import os
+import platform
+import subprocess
+import tracemalloc
+from time import perf_counter
+
+from bs4 import BeautifulSoup
+
+from scraper_app.parsers import (
+    ArgenpropParser,
+    LaVozParser,
+    MercadolibreParser,
+    ProperatiParser,
+    ZonapropParser,
+)
+from scraper_app.parsers.base import FAST_PARSER_BACKEND
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+PARSERS = {
+    'zonaprop': ZonapropParser,
+    'argenprop': ArgenpropParser,
+    'mercadolibre': MercadolibreParser,
+    'lavoz': LaVozParser,
+    'properati': ProperatiParser,
+}
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--repeat', type=int, default=10)
+parser.add_argument(
+    '--scales', type=int, nargs='*', default=[2000],
+    help='card counts of the synthetic pages, none to skip them',
+)
+parser.add_argument('--scaled-repeat', type=int, default=2)
+parser.add_argument('--output', help='write the results to this JSON file')
+parser.add_argument('--compare', help='JSON results of a previous run')
+args = parser.parse_args()
+
+BACKENDS = {
+    'html.parser': False,
+    '{}+strainer'.format(FAST_PARSER_BACKEND): True,
+}
+
+
+def scale_page(parser_class, html, cards):
+    '''
+    Repeats the cards of a saved page, with whatever wraps each of them
+    in the strainer, until the page has `cards` cards.
+    '''
+    spec = parser_class.spec
+    soup = BeautifulSoup(html, 'html.parser')
+    if spec.container_class is None:
+        found = soup.find_all(spec.container_tag)
+    else:
+        found = soup.find_all(spec.container_tag, class_=spec.container_class)
+
+    blocks = []
+    for card in found:
+        block = card
+        if spec.strainer_tag != spec.container_tag:
+            block = card.find_parent(spec.strainer_tag)
+        if block is not None and block not in blocks:
+            blocks.append(block)
+
+    last = blocks[-1]
+    for number in range(len(found), cards):
+        block = copy.copy(blocks[number % len(blocks)])
+        last.insert_after(block)
+        last = block
+
+    return str(soup)
+
+
+def parse(parser_class, html, fast_parse):
+    site_parser = parser_class(fast_parse=fast_parse)
+    site_parser.get_soup_object(html=html)
+    return site_parser.extract_records()
+
+
+def measure(parser_class, html, fast_parse, repeat):
+    tracemalloc.start()
+    records = parse(parser_class, html, fast_parse)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    started_at = perf_counter()
+    for _ in range(repeat):
+        parse(parser_class, html, fast_parse)
+    elapsed = (perf_counter() - started_at) / repeat
+
+    return records, elapsed, peak
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def result_key(result):
+    return (result['site'], result['page'], result['backend'])
+
+
+pages = []
+for site, parser_class in PARSERS.items():
+    with open(os.path.join(FIXTURES_DIR, '{}.html'.format(site))) as fh:
+        html = fh.read()
+    pages.append((site, 'saved', parser_class, html, args.repeat))
+    for cards in args.scales:
+        pages.append((
+            site,
+            'x{}'.format(cards),
+            parser_class,
+            scale_page(parser_class, html, cards),
+            args.scaled_repeat,
+        ))
+
+results = []
+for site, page, parser_class, html, repeat in pages:
+    shas = None
+    for backend, fast_parse in BACKENDS.items():
+        records, elapsed, peak = measure(parser_class, html, fast_parse, repeat)
+        page_shas = [record['sha'] for record in records]
+        assert shas is None or page_shas == shas, (site, page)
+        shas = page_shas
+        results.append({
+            'site': site,
+            'page': page,
+            'backend': backend,
+            'page_kib': round(len(html) / 1024),
+            'cards': len(records),
+            'ms_per_page': round(elapsed * 1000, 3),
+            'cards_per_second': round(len(records) / elapsed),
+            'peak_kib': round(peak / 1024),
+        })
+
+previous = {}
+if args.compare:
+    with open(args.compare) as fh:
+        previous = {
+            result_key(result): result for result in json.load(fh)['results']
+        }
+
+print('{:<14} {:<7} {:<18} {:>6} {:>10} {:>10} {:>10} {:>9}'.format(
+    'site', 'page', 'backend', 'cards', 'ms/page', 'cards/s', 'peak KiB',
+    'vs prev' if previous else '',
+))
+for result in results:
+    change = ''
+    before = previous.get(result_key(result))
+    if before:
+        change = '{:+.0%}'.format(
+            result['ms_per_page'] / before['ms_per_page'] - 1
+        )
+    print('{:<14} {:<7} {:<18} {:>6} {:>10.2f} {:>10} {:>10} {:>9}'.format(
+        result['site'],
+        result['page'],
+        result['backend'],
+        result['cards'],
+        result['ms_per_page'],
+        result['cards_per_second'],
+        result['peak_kib'],
+        change,
+    ))
+
+if args.output:
+    with open(args.output, 'w') as fh:
+        json.dump(
+            {
+                'commit': git_commit(),
+                'python': platform.python_version(),
+                'repeat': args.repeat,
+                'scaled_repeat': args.scaled_repeat,
+                'results': results,
+            },
+            fh,
+            indent=2,
+        )
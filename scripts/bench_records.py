@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Measure building scrape records as SQLModel postings vs ScrapedPosting.
+
+Takes the card records of the pages in scripts/fixtures, repeats them
+up to `--cards` cards and builds the per-page sets the pipeline uses,
+then dedupes them against a set of known shas.
+Usage: PYTHONPATH=. ./venv/bin/python scripts/bench_records.py
+"""
+import argparse
+import os
+import tracemalloc
+from itertools import cycle, islice
+from time import perf_counter
+
+from posting_app.database import Posting
+from posting_app.records import ScrapedPosting
+from scraper_app.parsers import (
+    ArgenpropParser,
+    LaVozParser,
+    MercadolibreParser,
+    ProperatiParser,
+    ZonapropParser,
+)
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+PARSERS = {
+    'zonaprop': ZonapropParser,
+    'argenprop': ArgenpropParser,
+    'mercadolibre': MercadolibreParser,
+    'lavoz': LaVozParser,
+    'properati': ProperatiParser,
+}
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--cards', type=int, default=1000)
+parser.add_argument('--known-ratio', type=float, default=0.95)
+parser.add_argument('--repeat', type=int, default=20)
+args = parser.parse_args()
+
+site_records = []
+for site, parser_class in PARSERS.items():
+    with open(os.path.join(FIXTURES_DIR, '{}.html'.format(site))) as fh:
+        site_parser = parser_class()
+        site_parser.get_soup_object(html=fh.read())
+        site_records.extend(site_parser.extract_records())
+
+records = []
+for number, record in enumerate(islice(cycle(site_records), args.cards)):
+    record = dict(record, sha='{}{:06d}'.format(record['sha'][:34], number))
+    records.append(record)
+known = {record['sha'] for record in records[:int(args.cards * args.known_ratio)]}
+
+
+def build_and_dedupe(record_class):
+    postings = {record_class(**record) for record in records}
+    return {posting for posting in postings if posting.sha not in known}
+
+
+def measure(record_class):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    postings = {record_class(**record) for record in records}
+    built, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del postings
+
+    started_at = perf_counter()
+    for _ in range(args.repeat):
+        unseen = build_and_dedupe(record_class)
+    elapsed = (perf_counter() - started_at) / args.repeat
+
+    return elapsed, built, peak, len(unseen)
+
+
+print('{} cards, {:.0%} already known'.format(args.cards, args.known_ratio))
+print('{:<16} {:>10} {:>14} {:>14} {:>8}'.format(
+    'record', 'ms', 'retained KiB', 'peak KiB', 'unseen'
+))
+for record_class in (Posting, ScrapedPosting):
+    elapsed, built, peak, unseen = measure(record_class)
+    print('{:<16} {:>10.2f} {:>14.0f} {:>14.0f} {:>8}'.format(
+        record_class.__name__, elapsed * 1000, built / 1024, peak / 1024, unseen
+    ))
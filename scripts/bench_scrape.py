@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""Measure end-to-end scrape throughput offline by replaying a cassette.
+
+Replays the responses recorded with `cassette_mode: record` through the
+full pipeline (gateway, parser, dedupe and inserts) for every site,
+against a throwaway database. With --from-fixtures it first writes a
+cassette out of the pages in scripts/fixtures, so it runs without ever
+having recorded the real sites.
+Usage: PYTHONPATH=. ./venv/bin/python scripts/bench_scrape.py --from-fixtures
+"""
+import argparse
+import os
+import tempfile
+from time import perf_counter
+
+from posting_app.database import (
+    configure_engine,
+    create_db_and_tables,
+    DatabaseConfig,
+)
+from posting_app.services import PostingServiceFactory
+from scraper_app.gateways import cassette, RecordedResponse
+from telegram_app.messages import rendered_columns
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+SITES = {
+    'zonaprop': (
+        PostingServiceFactory.build_for_zonaprop,
+        'https://www.zonaprop.com.ar/departamentos-alquiler-pagina-{}.html',
+    ),
+    'argenprop': (
+        PostingServiceFactory.build_for_argenprop,
+        'https://www.argenprop.com/departamentos/alquiler?pagina-{}',
+    ),
+    'mercadolibre': (
+        PostingServiceFactory.build_for_mercadolibre,
+        'https://inmuebles.mercadolibre.com.ar/departamentos/alquiler/_Desde_{}',
+    ),
+    'lavoz': (
+        PostingServiceFactory.build_for_la_voz,
+        'https://clasificados.lavoz.com.ar/inmuebles/departamentos?page={}',
+    ),
+    'properati': (
+        PostingServiceFactory.build_for_properati,
+        'https://www.properati.com.ar/s/alquiler/departamento/{}',
+    ),
+}
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--cassette-dir', default='cassettes')
+parser.add_argument('--from-fixtures', action='store_true')
+parser.add_argument('--pages', type=int, default=5)
+parser.add_argument('--concurrency', type=int, default=1)
+parser.add_argument('--latency', type=float, default=0.0)
+args = parser.parse_args()
+
+if args.from_fixtures:
+    cassette.configure('record', directory=args.cassette_dir)
+    for site, (_, url) in SITES.items():
+        with open(os.path.join(FIXTURES_DIR, '{}.html'.format(site))) as fh:
+            html = fh.read()
+        for page in range(1, args.pages + 1):
+            cassette.record(
+                url.format(page),
+                RecordedResponse(url=url.format(page), status_code=200, text=html),
+            )
+
+cassette.configure('replay', directory=args.cassette_dir, latency=args.latency)
+database_dir = tempfile.mkdtemp()
+configure_engine(
+    DatabaseConfig(database_path=os.path.join(database_dir, 'bench.db'))
+)
+create_db_and_tables()
+
+print('{} pages per site, {:.0f}ms simulated latency'.format(
+    args.pages, args.latency * 1000
+))
+print('{:<14} {:>10} {:>10} {:>12} {:>8}'.format(
+    'site', 'seconds', 'pages/s', 'postings/s', 'new'
+))
+total_elapsed, total_inserted = 0.0, 0
+for site, (build, url) in SITES.items():
+    posting_service = build(
+        pages=args.pages,
+        full_url=url,
+        concurrency=args.concurrency,
+        message_renderer=rendered_columns,
+    )
+    started_at = perf_counter()
+    inserted, _ = posting_service.scrap_and_create_postings()
+    elapsed = perf_counter() - started_at
+    total_elapsed += elapsed
+    total_inserted += inserted
+    print('{:<14} {:>10.2f} {:>10.1f} {:>12.1f} {:>8}'.format(
+        site, elapsed, args.pages / elapsed, inserted / elapsed, inserted
+    ))
+
+print('{:<14} {:>10.2f} {:>10.1f} {:>12.1f} {:>8}'.format(
+    'total',
+    total_elapsed,
+    args.pages * len(SITES) / total_elapsed,
+    total_inserted / total_elapsed,
+    total_inserted,
+))
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""Write-heavy benchmark comparing SQLite engine settings.
+
+Several threads insert postings one transaction at a time while
+another marks them as sent, like the scrape loop, the retry script
+and the cron run touching the database together.
+Usage: PYTHONPATH=. ./venv/bin/python scripts/bench_sqlite.py
+"""
+import argparse
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from sqlalchemy.exc import OperationalError
+
+from posting_app import database
+from posting_app.database import (
+    configure_engine,
+    create_db_and_tables,
+    DatabaseConfig,
+    Posting,
+    PostingRepository,
+)
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--writers', type=int, default=4)
+parser.add_argument('--rows', type=int, default=300, help='rows per writer')
+args = parser.parse_args()
+
+# What `create_engine('sqlite:///scrapdep.db')` used to give us
+LEGACY = dict(
+    database_journal_mode='delete',
+    database_synchronous='full',
+    database_cache_size=-2000,
+    database_mmap_size=0,
+    database_busy_timeout=5000,
+)
+
+
+def run(label: str, **settings):
+    workdir = tempfile.mkdtemp()
+    configure_engine(DatabaseConfig(
+        database_path=os.path.join(workdir, 'bench.db'), **settings
+    ))
+    create_db_and_tables()
+    repo = PostingRepository()
+    errors = []
+
+    def write(writer: int):
+        for row in range(args.rows):
+            sha = '{}-{}'.format(writer, row)
+            try:
+                repo.create_posting(Posting(sha=sha, url=sha))
+                if row % 10 == 9:
+                    repo.set_postings_as_sent(
+                        '{}-{}'.format(writer, sent) for sent in range(row - 9, row + 1)
+                    )
+            except OperationalError as ex:
+                errors.append(ex)
+
+    started_at = perf_counter()
+    with ThreadPoolExecutor(max_workers=args.writers) as executor:
+        list(executor.map(write, range(args.writers)))
+    elapsed = perf_counter() - started_at
+
+    rows = args.writers * args.rows
+    print('{:<8} {:>8.2f} s  {:>8.0f} rows/s  locked errors={}'.format(
+        label, elapsed, rows / elapsed, len(errors)
+    ))
+    database.engine.dispose()
+
+
+run('legacy', **LEGACY)
+run('tuned')
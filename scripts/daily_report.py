@@ -4,16 +4,25 @@ Usage: ./venv/bin/python scripts/daily_report.py
 (Prefer to schedule via cron at desired hour.)
 """
 import yaml
-from posting_app.database import PostingRepository
+from posting_app.database import (
+    configure_engine,
+    create_db_and_tables,
+    DatabaseConfig,
+    OutboxRepository,
+    PostingRepository,
+    SendFailureRepository,
+)
 from telegram_app.services import TelegramService
 from collections import Counter
 
 cfg = yaml.safe_load(open('config.yaml'))
+configure_engine(DatabaseConfig(**cfg))
+create_db_and_tables()
 repo = PostingRepository()
 
-postings = repo.get_unsent_postings()  # unsent
+postings = repo.iter_unsent_postings()  # unsent
 # compute totals
-all_count = len(postings)
+all_count = repo.count_unsent()
 # group by source inferred from url
 sources = Counter()
 for p in postings:
@@ -31,18 +40,19 @@ msg_lines = [
     f"MercadoLibre: {sources.get('mercadolibre',0)}",
     f"ZonaProp: {sources.get('zonaprop',0)}",
     f"Argenprop: {sources.get('argenprop',0)}",
+    f"Dead letters: {OutboxRepository().count_by_state().get('dead', 0)}",
 ]
 
 # attach recent failures
-try:
-    with open('send_failures.log','r',encoding='utf-8') as fh:
-        last = list(fh)[-5:]
-    if last:
-        msg_lines.append('\nLast failures:')
-        for l in last:
-            msg_lines.append(l[:300])
-except FileNotFoundError:
-    pass
+failures = SendFailureRepository().get_recent_failures(limit=5)
+if failures:
+    msg_lines.append('\nLast failures:')
+    for f in failures:
+        response = f.response_minimal or f.response_full or ''
+        msg_lines.append(
+            f"{f.created_at:%Y-%m-%d %H:%M} {f.sha[:10]} "
+            f"{f.status_full}/{f.status_minimal} {response[:200]}"
+        )
 
 msg = '\n'.join(msg_lines)
 tele = TelegramService(bot_token=cfg['bot_token'], chat_room=cfg['chat_room'])
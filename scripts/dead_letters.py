@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""List the postings that gave up being sent (the outbox dead letters).
+Usage: ./venv/bin/python scripts/dead_letters.py [--limit 50]
+Requeue them with scripts/retry_failed_sends.py.
+"""
+import argparse
+
+import yaml
+from posting_app.database import (
+    configure_engine,
+    create_db_and_tables,
+    DatabaseConfig,
+    OutboxRepository,
+)
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--limit', type=int, default=50)
+args = parser.parse_args()
+
+cfg = yaml.safe_load(open('config.yaml'))
+configure_engine(DatabaseConfig(**cfg))
+create_db_and_tables()
+
+repo = OutboxRepository()
+print('Outbox:', repo.count_by_state())
+for letter in repo.get_dead_letters(limit=args.limit):
+    print('{died_at} {sha:.10} attempts={attempts} {url}'.format(**letter))
+    print('    {}'.format((letter['last_error'] or '')[:200]))
@@ -2,14 +2,22 @@
 
 - For each group of postings with the same normalized SHA:
   - Keep one posting (prefer one already marked sent)
-  - Mark all other postings in the group as sent=True (duplicate)
+  - Discard all other postings in the group through the outbox (duplicate)
   - Update the kept posting's sha to the normalized SHA
 """
 from collections import defaultdict
+import yaml
 from sqlmodel import Session, select
-from posting_app.database import engine, Posting
+from posting_app.database import (
+    configure_engine,
+    DatabaseConfig,
+    OutboxRepository,
+    Posting,
+)
 from scraper_app.parsers.base import BaseParser
 
+cfg = yaml.safe_load(open('config.yaml'))
+engine = configure_engine(DatabaseConfig(**cfg))
 parser = BaseParser()
 
 with Session(engine) as s:
@@ -22,7 +30,7 @@ with Session(engine) as s:
         groups[norm].append(p)
 
     total_groups = 0
-    total_marked = 0
+    duplicates = []
 
     for norm_sha, posts in groups.items():
         if len(posts) <= 1:
@@ -49,18 +57,8 @@ with Session(engine) as s:
             # rollback and proceed to only mark duplicates as sent
             s.rollback()
 
-        # mark the rest as sent (duplicates) and commit per item
-        for p in posts:
-            if p is keeper:
-                continue
-            if not p.sent:
-                p.sent = True
-                s.add(p)
-                try:
-                    s.commit()
-                    total_marked += 1
-                except Exception:
-                    # If commit fails for any reason, rollback and continue
-                    s.rollback()
+        # the rest are duplicates, discarded below with their outbox messages
+        duplicates.extend(p.id for p in posts if p is not keeper and not p.sent)
 
+total_marked = OutboxRepository().discard_postings(duplicates)
 print(f'Normalized groups processed: {total_groups}. Marked duplicates as sent: {total_marked}.')
\ No newline at end of file
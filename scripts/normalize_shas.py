@@ -2,13 +2,21 @@
 
 This script will:
 - For each posting with sent == False, compute the new normalized sha using BaseParser.get_id
-- If another posting already exists with that normalized sha, mark the current posting as sent (considered duplicate)
+- If another posting already exists with that normalized sha, discard the current posting through the outbox (considered duplicate)
 - Otherwise update the posting's sha to the normalized sha
 """
+import yaml
 from sqlmodel import Session, select
-from posting_app.database import engine, Posting
+from posting_app.database import (
+    configure_engine,
+    DatabaseConfig,
+    OutboxRepository,
+    Posting,
+)
 from scraper_app.parsers.base import BaseParser
 
+cfg = yaml.safe_load(open('config.yaml'))
+engine = configure_engine(DatabaseConfig(**cfg))
 parser = BaseParser()
 
 with Session(engine) as s:
@@ -16,7 +24,7 @@ with Session(engine) as s:
     unsent = s.exec(stmt).all()
 
     updated = 0
-    deduped = 0
+    duplicates = []
 
     for p in unsent:
         new_sha = parser.get_id(p.url)
@@ -27,10 +35,8 @@ with Session(engine) as s:
         stmt2 = select(Posting).where(Posting.sha == new_sha)
         exists = s.exec(stmt2).first()
         if exists:
-            # mark this one as sent (duplicate)
-            p.sent = True
-            s.add(p)
-            deduped += 1
+            # duplicate, discarded below so its outbox message is settled too
+            duplicates.append(p.id)
         else:
             p.sha = new_sha
             s.add(p)
@@ -38,4 +44,5 @@ with Session(engine) as s:
 
     s.commit()
 
+deduped = OutboxRepository().discard_postings(duplicates)
 print(f'Updated SHAs: {updated}. Marked duplicates as sent: {deduped}.')
\ No newline at end of file
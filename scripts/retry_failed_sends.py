@@ -1,31 +1,41 @@
 #!/usr/bin/env python3
-"""Retry failed/unsent postings with configurable retries and backoff.
+"""Give the dead letters a fresh set of attempts and send the due postings.
+Safe to run next to main.py: messages are leased, so each one is sent by
+a single worker.
 Usage: ./venv/bin/python scripts/retry_failed_sends.py
 """
-import time
 import yaml
-from posting_app.database import PostingRepository
+from posting_app.database import (
+    configure_engine,
+    create_db_and_tables,
+    DatabaseConfig,
+    OutboxRepository,
+)
+from telegram_app.outbox import OutboxSender
 from telegram_app.services import TelegramService
 
 cfg = yaml.safe_load(open('config.yaml'))
-max_retries = cfg.get('max_retries', 3)
-backoff_base = cfg.get('retry_backoff_base', 1)
+configure_engine(DatabaseConfig(**cfg))
+create_db_and_tables()
 
-repo = PostingRepository()
-unsent = repo.get_unsent_postings()
-print('Total unsent postings:', len(unsent))
-tele = TelegramService(bot_token=cfg['bot_token'], chat_room=cfg['chat_room'])
+repo = OutboxRepository()
+queued = repo.enqueue_unsent_postings()
+requeued = repo.requeue_dead()
+print(f'Queued {queued} unsent postings, requeued {requeued} dead letters')
+print('Outbox:', repo.count_by_state())
 
-sent = 0
-failed = []
-for p in unsent:
-    ok = tele.send_with_retries(p, max_retries=max_retries, backoff_base=backoff_base)
-    if ok:
-        repo.set_posting_as_sent(p.sha)
-        sent += 1
-    else:
-        failed.append(p.sha)
+tele = TelegramService(bot_token=cfg['bot_token'], chat_room=cfg['chat_room'])
+sender = OutboxSender(
+    tele,
+    outbox_repository=repo,
+    workers=cfg.get('send_workers', 1),
+    claim_size=cfg.get('outbox_claim_size', 10),
+    lease_seconds=cfg.get('outbox_lease_seconds', 300),
+    max_attempts=cfg.get('outbox_max_attempts', 5),
+    retry_backoff=cfg.get('outbox_retry_backoff', 30),
+)
+sender.drain()
+tele.close()
 
-print(f'Retry finished. Sent: {sent}; Remaining failed: {len(failed)}')
-if failed:
-    print('Failed SHAs sample:', failed[:10])
+print(f'Retry finished. Sent: {sender.sent}; Failed attempts: {sender.failed}')
+print('Outbox:', repo.count_by_state())
@@ -0,0 +1,93 @@
+from threading import Lock
+from time import monotonic, sleep
+from typing import Dict
+
+# Telegram's documented limits: ~30 messages per second across all
+# chats and 20 messages per minute in the same group or channel
+GLOBAL_MESSAGES_PER_SECOND = 30
+CHAT_MESSAGES_PER_MINUTE = 20
+
+
+class TokenBucket:
+    '''
+    Allows `rate` calls per second with bursts of up to `burst`.
+    `pause` holds every call until the given seconds have passed, for
+    when Telegram answers with a `retry_after`.
+    '''
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated_at = monotonic()
+        self._paused_until = 0.0
+        self._lock = Lock()
+
+    def acquire(self):
+        '''Blocks until a call is allowed.'''
+        while True:
+            with self._lock:
+                now = monotonic()
+                self._tokens = min(
+                    self._tokens + (now - self._updated_at) * self.rate,
+                    self.burst,
+                )
+                self._updated_at = now
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = max(
+                    self._paused_until - now,
+                    (1 - self._tokens) / self.rate,
+                )
+            sleep(wait)
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self._paused_until = max(self._paused_until, monotonic() + seconds)
+            self._tokens = 0.0
+
+
+class TelegramRateLimiter:
+    '''
+    Global bucket plus one bucket per chat, shared by every
+    `TelegramService` in the process.
+    '''
+
+    def __init__(
+        self,
+        messages_per_second: float = GLOBAL_MESSAGES_PER_SECOND,
+        chat_messages_per_minute: float = CHAT_MESSAGES_PER_MINUTE,
+    ):
+        self._chats: Dict[str, TokenBucket] = {}
+        self._lock = Lock()
+        self.configure(messages_per_second, chat_messages_per_minute)
+
+    def configure(
+        self,
+        messages_per_second: float = GLOBAL_MESSAGES_PER_SECOND,
+        chat_messages_per_minute: float = CHAT_MESSAGES_PER_MINUTE,
+    ):
+        with self._lock:
+            self._global = TokenBucket(messages_per_second)
+            self._chat_rate = chat_messages_per_minute / 60
+            self._chats = {}
+
+    def acquire(self, chat_id: str):
+        self._chat_bucket(chat_id).acquire()
+        self._global.acquire()
+
+    def retry_after(self, chat_id: str, seconds: float):
+        '''Telegram asked to wait `seconds` before sending to the chat again.'''
+        self._chat_bucket(chat_id).pause(seconds)
+
+    def _chat_bucket(self, chat_id: str) -> TokenBucket:
+        with self._lock:
+            bucket = self._chats.get(chat_id)
+            if bucket is None:
+                bucket = TokenBucket(self._chat_rate)
+                self._chats[chat_id] = bucket
+            return bucket
+
+
+telegram_limiter = TelegramRateLimiter()
@@ -0,0 +1,107 @@
+from html import escape
+from typing import Callable, Dict, Tuple
+
+# Bump it whenever a template below changes, stored messages rendered
+# with an older version are rendered again before being sent
+MESSAGE_TEMPLATE_VERSION = 2
+
+# Telegram rejects longer messages, counted in UTF-16 code units
+MAX_MESSAGE_LENGTH = 4096
+ELLIPSIS = u'…'
+
+FULL_TEMPLATE = '<a href="{}"><b>{}</b></a>\n{}<i>{}</i>\n{}<i>{}</i>\n\n{}'
+MINIMAL_TEMPLATE = '<a href="{}"><b>{}</b></a>\n{}<i>{}</i>\n{}<i>{}</i>'
+
+
+def telegram_length(text: str) -> int:
+    '''
+    Length of `text` as Telegram counts it: in UTF-16 code units, so
+    characters outside the BMP (e.g. emoji) count twice.
+    '''
+    return len(text.encode('utf-16-le')) // 2
+
+
+def fits(text: str) -> bool:
+    return telegram_length(text) <= MAX_MESSAGE_LENGTH
+
+
+def shorten_to_fit(text: str, render: Callable[[str], str]) -> str:
+    '''
+    Renders the longest prefix of `text` (plus an ellipsis) for which
+    the message fits. Searched on the unescaped text, since escaping
+    changes its length.
+    '''
+    msg = render(text)
+    if fits(msg):
+        return msg
+
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if fits(render(text[:middle] + ELLIPSIS)):
+            low = middle
+        else:
+            high = middle - 1
+
+    return render(text[:low].rstrip() + ELLIPSIS)
+
+
+def render_full_message(posting) -> str:
+    '''
+    Formats the posting into a Telegram message. The description is cut
+    short when the message would go over Telegram's length limit.
+    '''
+    # Escape text parts to avoid HTML injection or invalid markup
+    title = escape(posting.title or '')
+    price = escape(posting.price or '')
+    location = escape(posting.location or '')
+    description = posting.description or ''
+
+    def render(text: str) -> str:
+        return FULL_TEMPLATE.format(
+            posting.url,
+            title,
+            u'\U0001F4B0',
+            price,
+            u'\U0001F4CD',
+            location,
+            escape(text),
+        )
+
+    return shorten_to_fit(description, render)
+
+
+def render_minimal_message(posting) -> str:
+    '''
+    Returns a short message consisting of link, title, price, location.
+    An absurdly long title is cut short to fit Telegram's limit.
+    '''
+    title = (posting.title or '').strip() or posting.sha
+    price = escape((posting.price or '').strip())
+    location = escape((posting.location or '').strip())
+
+    def render(text: str) -> str:
+        return MINIMAL_TEMPLATE.format(
+            posting.url,
+            escape(text),
+            u'\U0001F4B0',
+            price,
+            u'\U0001F4CD',
+            location,
+        )
+
+    return shorten_to_fit(title, render)
+
+
+def render_messages(posting) -> Tuple[str, str]:
+    return render_full_message(posting), render_minimal_message(posting)
+
+
+def rendered_columns(posting) -> Dict:
+    '''The `Posting` columns that store the pre-rendered messages.'''
+    full, minimal = render_messages(posting)
+    return {
+        'message_full': full,
+        'message_minimal': minimal,
+        'message_version': MESSAGE_TEMPLATE_VERSION,
+    }
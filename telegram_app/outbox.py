@@ -0,0 +1,226 @@
+import uuid
+from threading import Event, Thread
+from typing import List, Optional
+
+from rich.console import Console
+
+from posting_app.database import OutboxMessage, OutboxRepository
+from telegram_app.services import TelegramService
+
+console = Console()
+
+
+class OutboxSender:
+    '''
+    Worker threads that drain the outbox on their own schedule while
+    the scrapers keep queuing postings.
+
+    Every worker leases a few messages at a time. A message that fails
+    goes back to pending with exponential backoff (or Telegram's
+    retry_after) and is moved to the dead letters once it runs out of
+    attempts or Telegram rejects it for good. A worker that dies keeps
+    its messages only until their lease expires, so workers renew the
+    lease right before every send and skip the messages some other
+    worker claimed in the meantime (rate limits and `retry_after`
+    pauses can hold a batch for longer than the lease).
+
+    When the backlog reaches `digest_threshold` messages (e.g. a new
+    search or after downtime) workers claim `digest_claim_size` at a
+    time and pack them in digest messages, one request for many
+    postings.
+    '''
+
+    def __init__(
+        self,
+        telegram_service: TelegramService,
+        outbox_repository: Optional[OutboxRepository] = None,
+        workers: int = 1,
+        claim_size: int = 10,
+        lease_seconds: int = 300,
+        max_attempts: int = 5,
+        retry_backoff: float = 30,
+        poll_interval: float = 2,
+        oldest_first: bool = True,
+        digest_threshold: Optional[int] = None,
+        digest_claim_size: int = 40,
+    ):
+        self._telegram_service = telegram_service
+        self._outbox_repository = outbox_repository or OutboxRepository()
+        self._workers = workers
+        self._claim_size = claim_size
+        self._lease_seconds = lease_seconds
+        self._max_attempts = max_attempts
+        self._retry_backoff = retry_backoff
+        self._poll_interval = poll_interval
+        self._oldest_first = oldest_first
+        self._digest_threshold = digest_threshold
+        self._digest_claim_size = digest_claim_size
+        self._stop = Event()
+        self._threads: List[Thread] = []
+        self.sent = 0
+        self.failed = 0
+        self.errors = 0
+
+    def start(self):
+        '''Starts the workers in the background, they poll until `stop`.'''
+        self._stop.clear()
+        self._threads = [
+            Thread(target=self._work, args=(False,), daemon=True)
+            for _ in range(self._workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def drain(self):
+        '''Sends every due message with all the workers and returns.'''
+        self._stop.clear()
+        threads = [
+            Thread(target=self._work, args=(True,), daemon=True)
+            for _ in range(self._workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def stop(self):
+        '''Lets the workers finish the messages they hold and waits for them.'''
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _work(self, until_empty: bool):
+        '''
+        Claims and sends until stopped, or until nothing is due with
+        `until_empty`. Errors (e.g. the database being locked) are
+        logged and the worker carries on after `poll_interval`, a drain
+        gives up and leaves the rest for the next one.
+        '''
+        owner = uuid.uuid4().hex
+        while not self._stop.is_set():
+            try:
+                claimed_some = self._work_once(owner)
+            except Exception as ex:
+                self.errors += 1
+                console.log(
+                    '[bold u]ERROR[/bold u]: Outbox worker failed, {}'.format(
+                        'giving up until the next drain.' if until_empty
+                        else 'retrying in {}s.'.format(self._poll_interval)
+                    ),
+                    repr(ex),
+                    style='red'
+                )
+                if until_empty:
+                    return
+                self._stop.wait(self._poll_interval)
+                continue
+
+            if not claimed_some:
+                if until_empty:
+                    return
+                self._stop.wait(self._poll_interval)
+
+    def _work_once(self, owner: str) -> bool:
+        '''Claims one batch and sends it, False when nothing was due.'''
+        digest = self._digest_due()
+        claimed = self._outbox_repository.claim_messages(
+            owner,
+            limit=self._digest_claim_size if digest else self._claim_size,
+            lease_seconds=self._lease_seconds,
+            oldest_first=self._oldest_first,
+        )
+        if not claimed:
+            return False
+
+        if digest:
+            self._send_digests(claimed)
+            return True
+        for message, posting in claimed:
+            if not self._renew_leases([(message, posting)]):
+                continue
+            ok, res = self._telegram_service.attempt_send(posting)
+            self._record([message], [posting], ok, res)
+        return True
+
+    def _digest_due(self) -> bool:
+        if not self._digest_threshold:
+            return False
+        return self._outbox_repository.count_due() >= self._digest_threshold
+
+    def _renew_leases(self, claimed):
+        '''Returns the claimed messages this worker still holds.'''
+        held = self._outbox_repository.renew_leases(
+            [message for message, _ in claimed],
+            lease_seconds=self._lease_seconds,
+        )
+        return [(message, posting) for message, posting in claimed if message.id in held]
+
+    def _send_digests(self, claimed):
+        messages = {posting.id: message for message, posting in claimed}
+        console.log(f'Sending {len(claimed)} postings in digest messages')
+        remaining = claimed
+        while remaining:
+            # Packed one digest at a time, right after renewing the leases
+            remaining = self._renew_leases(remaining)
+            if not remaining:
+                return
+            text, postings = self._telegram_service.pack_digests(
+                [posting for _, posting in remaining]
+            )[0]
+            remaining = remaining[len(postings):]
+
+            ok, res = self._telegram_service.attempt_send_text(text)
+            if not ok and not self._telegram_service.should_retry(res):
+                # One bad posting shouldn't take the whole digest down
+                for posting in postings:
+                    message = messages[posting.id]
+                    if not self._renew_leases([(message, posting)]):
+                        continue
+                    ok, res = self._telegram_service.attempt_send(posting)
+                    self._record([message], [posting], ok, res)
+                continue
+            self._record(
+                [messages[posting.id] for posting in postings], postings, ok, res
+            )
+
+    def _record(self, messages: List[OutboxMessage], postings, ok: bool, res):
+        if ok:
+            marked = self._outbox_repository.mark_many_sent(messages)
+            self.sent += len(messages)
+            if marked < len(messages):
+                console.log(
+                    (
+                        '[bold u]WARNING[/bold u]: '
+                        f'{len(messages) - marked} messages were sent after '
+                        'their lease was taken by another worker.'
+                    ),
+                    style='yellow'
+                )
+            return
+
+        self.failed += len(messages)
+        error = 'no response' if res is None else '{} {}'.format(
+            res.status_code, res.text[:500]
+        )
+        retryable = self._telegram_service.should_retry(res)
+        retry_after = None if res is None else (
+            self._telegram_service.get_retry_after(res)
+        )
+        for message, posting in zip(messages, postings):
+            retry_in = None
+            if retryable and message.attempts < self._max_attempts:
+                retry_in = retry_after or (
+                    self._retry_backoff * 2 ** (message.attempts - 1)
+                )
+
+            self._outbox_repository.mark_failed(message, error, retry_in=retry_in)
+            if retry_in is None:
+                console.log(
+                    (
+                        '[bold u]WARNING[/bold u]: '
+                        f'Gave up sending {posting.title} after {message.attempts} '
+                        'attempts, it is in the dead letters.'
+                    ),
+                    style='yellow'
+                )
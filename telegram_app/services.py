@@ -1,139 +1,186 @@
 import requests
-from html import escape
-import time
-
-from posting_app.database import Posting
-import datetime
-import json
-import os
+from typing import List, Optional, Tuple
+
+from posting_app.database import (
+    Posting,
+    PostingRepository,
+    SendFailure,
+    SendFailureRepository,
+)
+from telegram_app.limiter import telegram_limiter, TelegramRateLimiter
+from telegram_app.messages import (
+    fits,
+    MAX_MESSAGE_LENGTH,
+    MESSAGE_TEMPLATE_VERSION,
+    rendered_columns,
+    telegram_length,
+)
+
+DIGEST_SEPARATOR = '\n\n'
 
 
 class TelegramService:
+    # Times a message answered with 429 is retried after its retry_after
+    max_throttle_retries = 3
+
     def __init__(
         self,
         bot_token: str,
-        chat_room: str
+        chat_room: str,
+        limiter: TelegramRateLimiter = telegram_limiter,
+        pool_size: int = 4,
     ):
         self._bot_token = bot_token
         self._chat_room = chat_room
+        self._limiter = limiter
+        self._failure_repository = SendFailureRepository()
+        self._posting_repository = PostingRepository()
+        # Keep-alive connections to the Bot API, shared by the sender threads
+        self._session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size
+        )
+        self._session.mount('https://', adapter)
 
     def format_posting_to_message(self, posting: Posting) -> str:
         '''Formats the object into a Telegram message.'''
-        # Escape text parts to avoid HTML injection or invalid markup
-        title = escape(posting.title or '')
-        price = escape(posting.price or '')
-        location = escape(posting.location or '')
-        description = escape(posting.description or '')
-
-        msg = '<a href="{}"><b>{}</b></a>\n{}<i>{}</i>\n{}<i>{}</i>\n\n{}'.format(
-            posting.url,
-            title,
-            u'\U0001F4B0',
-            price,
-            u'\U0001F4CD',
-            location,
-            description,
-        )
+        return self.get_messages(posting)[0]
+
+    def get_messages(self, posting: Posting) -> Tuple[str, str]:
+        """Return the full and minimal messages stored with the posting.
+
+        Postings stored before the current template version (or before
+        messages were stored at all) get them rendered and saved again.
+        """
+        if (
+            getattr(posting, 'message_version', None) == MESSAGE_TEMPLATE_VERSION
+            and posting.message_full
+            and posting.message_minimal
+        ):
+            return posting.message_full, posting.message_minimal
+
+        columns = rendered_columns(posting)
+        if isinstance(posting, Posting):
+            for column, value in columns.items():
+                setattr(posting, column, value)
+            self._posting_repository.set_messages(posting.sha, columns)
+        return columns['message_full'], columns['message_minimal']
 
-        return msg
-    
     def _post_message(self, msg_text: str):
-        """Post message and return response or None on exception."""
+        """Post message and return response or None on exception.
+
+        Waits for the global and per-chat rate limits first. A 429 pauses
+        the chat for the retry_after Telegram sends and tries again.
+        """
         api_url = f'https://api.telegram.org/bot{self._bot_token}/sendMessage'
         params = {
             'chat_id': self._chat_room,
             'text': msg_text,
             'parse_mode': 'HTML',
         }
+        for _ in range(self.max_throttle_retries + 1):
+            self._limiter.acquire(self._chat_room)
+            try:
+                res = self._session.post(api_url, data=params, timeout=10)
+            except requests.RequestException:
+                return None
+            if res.status_code != 429:
+                return res
+            self._limiter.retry_after(
+                self._chat_room, self.get_retry_after(res) or 1
+            )
+
+        return res
+
+    def get_retry_after(self, res) -> Optional[int]:
+        """The retry_after Telegram sends in the JSON body of a 429."""
         try:
-            res = requests.post(api_url, data=params, timeout=10)
-            return res
-        except requests.RequestException:
+            return res.json().get('parameters', {}).get('retry_after')
+        except (ValueError, AttributeError):
             return None
 
+    def close(self):
+        self._session.close()
+
     def send_telegram_message(self, msg_text: str) -> bool:
         res = self._post_message(msg_text)
         return bool(res and res.ok)
 
     def format_minimal_message(self, posting: Posting) -> str:
         """Return a short message consisting of link, title, price, location."""
-        title = escape((posting.title or '').strip())
-        price = escape((posting.price or '').strip())
-        location = escape((posting.location or '').strip())
-        minimal = '<a href="{}"><b>{}</b></a>\n{}<i>{}</i>\n{}<i>{}</i>'.format(
-            posting.url,
-            title or posting.sha,
-            u'\U0001F4B0',
-            price,
-            u'\U0001F4CD',
-            location,
-        )
-        return minimal
+        return self.get_messages(posting)[1]
+
+    def pack_digests(self, postings: List[Posting]) -> List[Tuple[str, List[Posting]]]:
+        """Pack the postings in as few messages as fit Telegram's length limit.
+
+        Each posting goes in its full format, or in the minimal one when
+        the full one doesn't fit in the room left in the current message.
+        Lengths are counted in UTF-16 code units on the HTML source,
+        which is never shorter than the text Telegram counts.
+
+        Messages are never sliced, that could cut an HTML tag in half.
+        A posting too long even in its minimal format goes alone in its
+        digest, so only that one gets rejected and dead-lettered.
+        """
+        digests = []
+        parts, packed = [], []
+        length = 0
+        for posting in postings:
+            separator = telegram_length(DIGEST_SEPARATOR) if parts else 0
+            room = MAX_MESSAGE_LENGTH - length - separator
+            part = self.format_posting_to_message(posting)
+            if telegram_length(part) > room:
+                part = self.format_minimal_message(posting)
+            if telegram_length(part) > room and parts:
+                digests.append((DIGEST_SEPARATOR.join(parts), packed))
+                parts, packed, length, separator = [], [], 0, 0
+                part = self.format_posting_to_message(posting)
+                if not fits(part):
+                    part = self.format_minimal_message(posting)
+            parts.append(part)
+            packed.append(posting)
+            length += separator + telegram_length(part)
+
+        if parts:
+            digests.append((DIGEST_SEPARATOR.join(parts), packed))
+        return digests
+
+    def attempt_send_text(self, msg_text: str):
+        """Returns whether the message was sent and the response when it wasn't."""
+        res = self._post_message(msg_text)
+        if res and res.ok:
+            return True, None
+        return False, res
 
-    def send_posting_with_fallback(self, posting: Posting) -> bool:
-        """Try sending full message; on failure try minimal; log final failure details."""
+    def attempt_send(self, posting: Posting):
+        """Returns whether the posting was sent and the last failed response."""
         full_msg = self.format_posting_to_message(posting)
-        res = self._post_message(full_msg)
-        if res and res.ok:
-            return True
+        res = None
+        # Telegram would reject it anyway, don't waste a request on it
+        if fits(full_msg):
+            res = self._post_message(full_msg)
+            if res and res.ok:
+                return True, None
 
         # attempt minimal message
         minimal = self.format_minimal_message(posting)
         res2 = self._post_message(minimal)
         if res2 and res2.ok:
-            return True
-
-        # both failed: log details
-        log_entry = {
-            'timestamp': datetime.datetime.utcnow().isoformat(),
-            'sha': posting.sha,
-            'url': posting.url,
-            'status_full': None if res is None else res.status_code,
-            'status_minimal': None if res2 is None else res2.status_code,
-            'response_full': None if res is None else (res.text[:1000] if hasattr(res, 'text') else str(res)),
-            'response_minimal': None if res2 is None else (res2.text[:1000] if hasattr(res2, 'text') else str(res2)),
-        }
-        log_path = os.path.join(os.getcwd(), 'send_failures.log')
-        with open(log_path, 'a', encoding='utf-8') as fh:
-            fh.write(json.dumps(log_entry, ensure_ascii=False) + '\n')
-
-        return False
-
-    def send_with_retries(self, posting: Posting, max_retries: int = 3, backoff_base: int = 1) -> bool:
-        """Try sending a posting with retries and backoff. On 429 respect retry_after when provided."""
-        attempt = 0
-        while attempt < max_retries:
-            attempt += 1
-            # try full message + fallback inside send_posting_with_fallback
-            ok = self.send_posting_with_fallback(posting)
-            if ok:
-                return True
-
-            # If failed, try to parse last log entry for this sha to respect retry_after
-            retry_after = None
-            try:
-                log_path = os.path.join(os.getcwd(), 'send_failures.log')
-                if os.path.exists(log_path):
-                    with open(log_path, 'r', encoding='utf-8') as fh:
-                        lines = [l for l in fh if posting.sha in l]
-                    if lines:
-                        last = json.loads(lines[-1])
-                        # try extract retry_after from response texts
-                        resp = last.get('response_full') or last.get('response_minimal') or ''
-                        import re
-                        m = re.search(r'retry after (\d+)', resp)
-                        if m:
-                            retry_after = int(m.group(1))
-            except Exception:
-                retry_after = None
-
-            if retry_after:
-                sleep_time = retry_after + 2
-            else:
-                sleep_time = backoff_base * (2 ** (attempt - 1))
-
-            time_msg = f'Attempt {attempt}/{max_retries} failed; sleeping {sleep_time}s before retrying.'
-            print(time_msg)
-            time.sleep(sleep_time)
-
-        return False
\ No newline at end of file
+            return True, None
+
+        # both failed: store details
+        last_res = res2 if res2 is not None else res
+        self._failure_repository.add_failure(SendFailure(
+            sha=posting.sha,
+            status_full=None if res is None else res.status_code,
+            status_minimal=None if res2 is None else res2.status_code,
+            response_full=None if res is None else res.text[:1000],
+            response_minimal=None if res2 is None else res2.text[:1000],
+            retry_after=None if last_res is None else self.get_retry_after(last_res),
+        ))
+
+        return False, last_res
+
+    def should_retry(self, res) -> bool:
+        """Network errors, 429 and server errors may work later, anything else won't."""
+        return res is None or res.status_code == 429 or res.status_code >= 500
@@ -0,0 +1,24 @@
+import pytest
+
+from posting_app import database
+from posting_app.database import (
+    configure_engine,
+    create_db_and_tables,
+    DatabaseConfig,
+    known_listing_ids,
+    known_shas,
+)
+
+
+@pytest.fixture
+def db(tmp_path):
+    '''A fresh SQLite database in place of the module engine.'''
+    configure_engine(DatabaseConfig(database_path=str(tmp_path / 'test.db')))
+    create_db_and_tables()
+    known_shas.clear()
+    known_listing_ids.clear()
+    yield database.engine
+    known_shas.clear()
+    known_listing_ids.clear()
+    database.engine.dispose()
+
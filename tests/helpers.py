@@ -0,0 +1,11 @@
+from posting_app.records import ScrapedPosting
+
+
+def make_posting(number: int, **fields) -> ScrapedPosting:
+    '''A scraped posting whose sha and url derive from `number`.'''
+    fields.setdefault('title', 'Departamento {}'.format(number))
+    return ScrapedPosting(
+        sha='{:040x}'.format(number),
+        url='https://example.com/departamento-{}.html'.format(number),
+        **fields
+    )
@@ -0,0 +1,69 @@
+from contextlib import contextmanager
+
+import pytest
+
+from scraper_app.gateways import (
+    Cassette,
+    RateLimiterPool,
+    RecordedResponse,
+    ResponseCache,
+    ZonapropGateway,
+)
+
+URL = 'https://www.zonaprop.com.ar/departamentos-alquiler-pagina-1.html'
+PAGE = '<html><body>page</body></html>'
+
+
+class FakeSessionPool:
+    '''Answers like a server that supports conditional requests.'''
+
+    def __init__(self):
+        self.requests = []
+
+    @contextmanager
+    def session(self, key):
+        yield self
+
+    def rebuild(self, key, stale=None):
+        pass
+
+    def get(self, url, headers):
+        self.requests.append(headers)
+        if 'If-None-Match' in headers:
+            return RecordedResponse(url=url, status_code=304, text='')
+        return RecordedResponse(
+            url=url, status_code=200, text=PAGE, headers={'ETag': '"v1"'}
+        )
+
+
+@pytest.fixture
+def gateway(tmp_path):
+    gateway = ZonapropGateway()
+    gateway.session_pool = FakeSessionPool()
+    gateway.rate_limiter = RateLimiterPool()
+    gateway.response_cache = ResponseCache()
+    gateway.response_cache.configure(str(tmp_path / 'http_cache'))
+    gateway.cassette = Cassette()
+    gateway.cassette.configure('record', directory=str(tmp_path / 'cassettes'))
+    return gateway
+
+
+def test_recording_over_several_cycles_keeps_the_page(gateway):
+    for _ in range(3):
+        assert gateway.make_request(URL) == PAGE
+        gateway.commit_page(URL)
+
+    assert gateway.session_pool.requests == [{}, {}, {}]
+    assert gateway.cassette.replay(URL).text == PAGE
+
+
+def test_a_304_is_not_recorded(gateway):
+    gateway.cassette.record(
+        URL, RecordedResponse(url=URL, status_code=200, text=PAGE)
+    )
+
+    gateway.cassette.record(
+        URL, RecordedResponse(url=URL, status_code=304, text='')
+    )
+
+    assert gateway.cassette.replay(URL).text == PAGE
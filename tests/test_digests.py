@@ -0,0 +1,101 @@
+import re
+
+import pytest
+
+from telegram_app.messages import (
+    MAX_MESSAGE_LENGTH,
+    render_full_message,
+    render_minimal_message,
+    telegram_length,
+)
+from telegram_app.services import DIGEST_SEPARATOR, TelegramService
+from tests.helpers import make_posting
+
+EMOJI = u'\U0001F3E0'
+
+
+@pytest.fixture
+def telegram_service():
+    telegram_service = TelegramService(bot_token='token', chat_room='chat')
+    yield telegram_service
+    telegram_service.close()
+
+
+def test_telegram_length_counts_utf16_units():
+    assert telegram_length('abc') == 3
+    assert telegram_length(u'ñ') == 1
+    assert telegram_length(EMOJI) == 2
+
+
+def test_long_description_is_cut_to_fit():
+    posting = make_posting(1, description=EMOJI * MAX_MESSAGE_LENGTH)
+
+    message = render_full_message(posting)
+
+    assert telegram_length(message) <= MAX_MESSAGE_LENGTH
+    assert message.endswith(u'…')
+
+
+def test_long_title_is_cut_in_the_minimal_message():
+    posting = make_posting(1, title='<b>' * MAX_MESSAGE_LENGTH)
+
+    message = render_minimal_message(posting)
+
+    assert telegram_length(message) <= MAX_MESSAGE_LENGTH
+    # Cut before escaping, so no entity is left half written
+    assert re.search(u'&[a-z]*…', message) is None
+
+
+def test_digests_fit_telegram_limit(telegram_service):
+    postings = [
+        make_posting(number, description=EMOJI * 400)
+        for number in range(1, 41)
+    ]
+
+    digests = telegram_service.pack_digests(postings)
+
+    assert 1 < len(digests) < len(postings)
+    assert [
+        posting for _, packed in digests for posting in packed
+    ] == postings
+    for text, packed in digests:
+        assert telegram_length(text) <= MAX_MESSAGE_LENGTH
+        assert text.count('<a href=') == len(packed)
+
+
+def test_digest_uses_minimal_message_when_tight(telegram_service):
+    postings = [
+        make_posting(1, description='x' * (MAX_MESSAGE_LENGTH - 300)),
+        make_posting(2, description='y' * 1000),
+    ]
+
+    [(text, packed)] = telegram_service.pack_digests(postings)
+
+    assert packed == postings
+    assert text.endswith(render_minimal_message(postings[1]))
+    assert 'y' * 1000 not in text
+
+
+def test_oversized_posting_goes_alone_unsliced(telegram_service):
+    huge = make_posting(2)
+    huge.url = 'https://example.com/' + 'a' * MAX_MESSAGE_LENGTH
+    postings = [make_posting(1), huge, make_posting(3)]
+
+    digests = telegram_service.pack_digests(postings)
+
+    assert [packed for _, packed in digests] == [
+        [postings[0]], [huge], [postings[2]]
+    ]
+    assert digests[1][0] == render_minimal_message(huge)
+    assert digests[1][0].endswith('</i>')
+
+
+def test_single_digest_joins_with_separator(telegram_service):
+    postings = [make_posting(number) for number in range(1, 4)]
+
+    [(text, packed)] = telegram_service.pack_digests(postings)
+
+    assert packed == postings
+    assert text == DIGEST_SEPARATOR.join(
+        render_full_message(posting) for posting in postings
+    )
@@ -0,0 +1,57 @@
+import pytest
+
+from scraper_app.parsers import (
+    ArgenpropParser,
+    LaVozParser,
+    MercadolibreParser,
+    ZonapropParser,
+)
+
+
+@pytest.mark.parametrize('parser, url, listing_id', [
+    (
+        ZonapropParser,
+        'https://www.zonaprop.com.ar/propiedades/clasificado/'
+        'alclapin-depto-2-amb-palermo-50123456.html',
+        50123456,
+    ),
+    (
+        ArgenpropParser,
+        'https://www.argenprop.com/departamento-en-alquiler-en-palermo--15123456',
+        15123456,
+    ),
+    (
+        ArgenpropParser,
+        'https://www.argenprop.com/departamento-en-alquiler-en-palermo--15123456?x=1',
+        15123456,
+    ),
+    (
+        MercadolibreParser,
+        'https://departamento.mercadolibre.com.ar/MLA-1412345678-depto-palermo-_JM',
+        1412345678,
+    ),
+    (
+        MercadolibreParser,
+        'https://departamento.mercadolibre.com.ar/MLA1412345678',
+        1412345678,
+    ),
+    (
+        LaVozParser,
+        'https://clasificados.lavoz.com.ar/avisos/departamentos/4987654/depto-centro',
+        4987654,
+    ),
+])
+def test_listing_id_from_url(parser, url, listing_id):
+    assert parser.spec.listing_id(url) == listing_id
+
+
+@pytest.mark.parametrize('parser, url', [
+    # Digits that aren't the listing id must not match
+    (ZonapropParser, 'https://www.zonaprop.com.ar/departamentos-alquiler-pagina-2'),
+    (ArgenpropParser, 'https://www.argenprop.com/departamento-2-ambientes-15123456'),
+    (ArgenpropParser, 'https://www.argenprop.com/departamento--15123456abc'),
+    (MercadolibreParser, 'https://inmuebles.mercadolibre.com.ar/_Desde_49'),
+    (LaVozParser, 'https://clasificados.lavoz.com.ar/inmuebles/departamentos?page=2'),
+])
+def test_listing_id_missing(parser, url):
+    assert parser.spec.listing_id(url) is None
@@ -0,0 +1,284 @@
+import time
+
+from sqlalchemy import delete, text, update
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, select
+
+from posting_app import database
+from posting_app.database import (
+    OUTBOX_DEAD,
+    OUTBOX_IN_FLIGHT,
+    OUTBOX_PENDING,
+    OUTBOX_SENT,
+    OutboxMessage,
+    OutboxRepository,
+    Posting,
+    PostingRepository,
+    create_db_and_tables,
+)
+from telegram_app.outbox import OutboxSender
+from tests.helpers import make_posting
+
+
+def store_postings(amount: int):
+    PostingRepository().insert_postings(
+        [make_posting(number) for number in range(1, amount + 1)]
+    )
+
+
+def get_message(posting_id: int) -> OutboxMessage:
+    with Session(database.engine) as session:
+        return session.exec(
+            select(OutboxMessage).where(OutboxMessage.posting_id == posting_id)
+        ).one()
+
+
+def get_posting(posting_id: int) -> Posting:
+    with Session(database.engine) as session:
+        return session.get(Posting, posting_id)
+
+
+class FakeTelegramService:
+    '''Answers every send with the given result, without any network.'''
+
+    def __init__(self, ok: bool):
+        self.ok = ok
+        self.sent = []
+
+    def attempt_send(self, posting):
+        self.sent.append(posting.sha)
+        return self.ok, None
+
+    def should_retry(self, res) -> bool:
+        return res is None
+
+    def get_retry_after(self, res):
+        return None
+
+
+def test_inserted_postings_are_queued(db):
+    store_postings(3)
+
+    assert OutboxRepository().count_by_state() == {OUTBOX_PENDING: 3}
+
+
+def test_claimed_messages_are_not_claimed_again(db):
+    store_postings(3)
+    outbox = OutboxRepository()
+
+    first = outbox.claim_messages('a', limit=2)
+    second = outbox.claim_messages('b', limit=2)
+
+    assert [message.id for message, _ in first] == [1, 2]
+    assert [message.id for message, _ in second] == [3]
+    assert outbox.claim_messages('c', limit=2) == []
+    assert get_message(first[0][0].posting_id).lease_owner == 'a'
+
+
+def test_expired_lease_is_claimed_again(db):
+    store_postings(1)
+    outbox = OutboxRepository()
+
+    [(expired, _)] = outbox.claim_messages('a', lease_seconds=-1)
+    [(claimed, posting)] = outbox.claim_messages('b')
+
+    assert claimed.id == expired.id
+    assert claimed.attempts == 2
+    assert posting.id == claimed.posting_id
+    assert outbox.renew_leases([expired]) == set()
+    assert outbox.renew_leases([claimed]) == {claimed.id}
+
+
+def test_only_the_lease_owner_marks_sent(db):
+    store_postings(1)
+    outbox = OutboxRepository()
+    [(expired, _)] = outbox.claim_messages('a', lease_seconds=-1)
+    [(claimed, _)] = outbox.claim_messages('b')
+
+    assert outbox.mark_sent(expired) == 0
+    assert get_message(claimed.posting_id).state == OUTBOX_IN_FLIGHT
+    assert not get_posting(claimed.posting_id).sent
+
+    assert outbox.mark_sent(claimed) == 1
+    assert get_message(claimed.posting_id).state == OUTBOX_SENT
+    assert get_posting(claimed.posting_id).sent
+
+
+def test_only_the_lease_owner_marks_failed(db):
+    store_postings(1)
+    outbox = OutboxRepository()
+    [(expired, _)] = outbox.claim_messages('a', lease_seconds=-1)
+    [(claimed, _)] = outbox.claim_messages('b')
+
+    outbox.mark_failed(expired, 'timeout', retry_in=None)
+
+    message = get_message(claimed.posting_id)
+    assert message.state == OUTBOX_IN_FLIGHT
+    assert message.lease_owner == 'b'
+    assert message.last_error is None
+
+
+def test_failed_message_waits_for_its_backoff(db):
+    store_postings(1)
+    outbox = OutboxRepository()
+    [(message, _)] = outbox.claim_messages('a')
+
+    outbox.mark_failed(message, '502 Bad Gateway', retry_in=60)
+
+    stored = get_message(message.posting_id)
+    assert stored.state == OUTBOX_PENDING
+    assert stored.lease_owner is None
+    assert outbox.count_due() == 0
+    assert outbox.claim_messages('a') == []
+
+
+def test_dead_letters_are_requeued(db):
+    store_postings(2)
+    outbox = OutboxRepository()
+    [(message, _), _] = outbox.claim_messages('a')
+
+    outbox.mark_failed(message, '400 Bad Request', retry_in=None)
+
+    assert get_message(message.posting_id).state == OUTBOX_DEAD
+    [dead_letter] = outbox.get_dead_letters()
+    assert dead_letter['sha'] == make_posting(1).sha
+    assert dead_letter['last_error'] == '400 Bad Request'
+
+    assert outbox.requeue_dead() == 1
+    stored = get_message(message.posting_id)
+    assert stored.state == OUTBOX_PENDING
+    assert stored.attempts == 0
+    assert outbox.get_dead_letters() == []
+
+
+def test_sender_dead_letters_after_max_attempts(db):
+    store_postings(2)
+    telegram_service = FakeTelegramService(ok=False)
+    sender = OutboxSender(telegram_service, max_attempts=3, retry_backoff=0)
+
+    sender.drain()
+
+    assert len(telegram_service.sent) == 6
+    assert OutboxRepository().count_by_state() == {OUTBOX_DEAD: 2}
+    assert get_message(1).attempts == 3
+
+
+def test_sender_sends_each_posting_once(db):
+    store_postings(25)
+    telegram_service = FakeTelegramService(ok=True)
+    sender = OutboxSender(telegram_service, workers=3, claim_size=4)
+
+    sender.drain()
+
+    assert sorted(telegram_service.sent) == sorted(
+        make_posting(number).sha for number in range(1, 26)
+    )
+    assert OutboxRepository().count_by_state() == {OUTBOX_SENT: 25}
+    assert sender.sent == 25
+
+
+def test_renamed_and_sent_postings_are_settled(db):
+    store_postings(12)
+    with Session(database.engine) as session:
+        session.execute(update(Posting).where(Posting.id == 1).values(sent=True))
+        for posting_id in range(2, 12):
+            session.execute(
+                update(Posting)
+                .where(Posting.id == posting_id)
+                .values(sha='{:040x}'.format(1000 + posting_id))
+            )
+        session.commit()
+    telegram_service = FakeTelegramService(ok=True)
+
+    OutboxSender(telegram_service, claim_size=5).drain()
+
+    assert len(telegram_service.sent) == 11
+    assert make_posting(1).sha not in telegram_service.sent
+    assert OutboxRepository().count_by_state() == {OUTBOX_SENT: 12}
+    assert get_message(1).sent_at is None
+
+
+def test_orphan_messages_are_dead_lettered(db):
+    store_postings(2)
+    with Session(database.engine) as session:
+        session.execute(delete(Posting).where(Posting.id == 2))
+        session.commit()
+    outbox = OutboxRepository()
+
+    assert outbox.count_due() == 1
+    assert [message.posting_id for message, _ in outbox.claim_messages('a')] == [1]
+    [dead_letter] = outbox.get_dead_letters()
+    assert dead_letter['posting_id'] == 2
+    assert dead_letter['url'] is None
+    assert dead_letter['last_error'] == 'posting no longer exists'
+
+
+def test_discarded_postings_are_not_sent(db):
+    store_postings(3)
+    outbox = OutboxRepository()
+
+    assert outbox.discard_postings([1, 2]) == 2
+
+    assert get_posting(1).sent
+    assert get_message(1).state == OUTBOX_SENT
+    assert [message.posting_id for message, _ in outbox.claim_messages('a')] == [3]
+
+
+def test_outbox_keyed_by_sha_is_migrated(db):
+    store_postings(3)
+    with database.engine.begin() as connection:
+        connection.execute(text('DROP VIEW outbox_dead_letter'))
+        connection.execute(text('DROP TABLE outboxmessage'))
+        connection.execute(text(
+            'CREATE TABLE outboxmessage (id INTEGER PRIMARY KEY, '
+            'sha VARCHAR UNIQUE, state VARCHAR, attempts INTEGER, '
+            'available_at DATETIME, lease_owner VARCHAR, last_error VARCHAR, '
+            'created_at DATETIME, sent_at DATETIME)'
+        ))
+        connection.execute(text('CREATE INDEX ix_outboxmessage_state ON outboxmessage (state)'))
+        connection.execute(text(
+            "INSERT INTO outboxmessage (sha, state, attempts, available_at, created_at) "
+            "SELECT sha, 'pending', 1, '2000-01-01', '2000-01-01' FROM posting"
+        ))
+        connection.execute(text(
+            "INSERT INTO outboxmessage (sha, state, attempts, available_at, created_at) "
+            "VALUES ('renamed', 'pending', 0, '2000-01-01', '2000-01-01')"
+        ))
+
+    create_db_and_tables()
+
+    assert OutboxRepository().count_by_state() == {OUTBOX_PENDING: 3}
+    assert get_message(2).attempts == 1
+
+
+class LockedOnceOutboxRepository(OutboxRepository):
+    '''Fails the first claim like a locked database would.'''
+
+    def __init__(self):
+        self.claims = 0
+
+    def claim_messages(self, *args, **kwargs):
+        self.claims += 1
+        if self.claims == 1:
+            raise OperationalError('UPDATE outboxmessage', {}, 'database is locked')
+        return super().claim_messages(*args, **kwargs)
+
+
+def test_worker_survives_errors(db):
+    store_postings(3)
+    telegram_service = FakeTelegramService(ok=True)
+    sender = OutboxSender(
+        telegram_service,
+        outbox_repository=LockedOnceOutboxRepository(),
+        poll_interval=0.01,
+    )
+
+    sender.start()
+    for _ in range(200):
+        if sender.sent == 3:
+            break
+        time.sleep(0.01)
+    sender.stop()
+
+    assert sender.errors == 1
+    assert sender.sent == 3
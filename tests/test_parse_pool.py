@@ -0,0 +1,43 @@
+import os
+from concurrent.futures import Future
+
+from scraper_app import services
+from scraper_app.parsers.base import parse_records
+from scraper_app.services import ScraperServiceFactory
+
+FIXTURES_DIR = os.path.join(
+    os.path.dirname(__file__), os.pardir, 'scripts', 'fixtures'
+)
+URL = 'https://www.zonaprop.com.ar/departamentos-alquiler-pagina-{}.html'
+
+
+class InlineParsePool:
+    '''Parses right away in this process, like a pool with idle workers.'''
+
+    def submit(self, parser, html: str) -> Future:
+        future = Future()
+        future.set_result(parse_records(type(parser), parser.fast_parse, html))
+        return future
+
+
+def test_pages_are_handed_over_while_fetching(monkeypatch):
+    monkeypatch.setattr(services, 'parse_pool', InlineParsePool())
+    with open(os.path.join(FIXTURES_DIR, 'zonaprop.html')) as fh:
+        html = fh.read()
+    scraper_service = ScraperServiceFactory.build_for_zonaprop(
+        pages=3, full_url=URL
+    )
+    fetched = []
+
+    def fetch_pages():
+        for page in range(1, 4):
+            fetched.append(page)
+            yield URL.format(page), html
+
+    parsed = scraper_service._parse_in_pool(fetch_pages())
+
+    url, postings = next(parsed)
+    assert url == URL.format(1)
+    assert len(postings) == 30
+    assert fetched == [1]
+    assert [url for url, _ in parsed] == [URL.format(2), URL.format(3)]